@@ -1,6 +1,7 @@
 import json
 import logging
 import time
+from collections import OrderedDict
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 from synapse.module_api import ModuleApi
@@ -20,10 +21,13 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger("synapse.module.synapse_room_preview.get_room_preview")
 
-# In-memory cache for room preview data
+# In-memory LRU cache for room preview data, least recently used rooms first
 # Structure: {room_id: (data, timestamp)}
-_room_cache: Dict[str, Tuple[Dict[str, Dict[str, Any]], float]] = {}
+_room_cache: "OrderedDict[str, Tuple[Dict[str, Dict[str, Any]], float]]" = OrderedDict()
 _CACHE_TTL_SECONDS = 300  # 5 minutes TTL (increased due to reactive invalidation)
+_CACHE_MAX_ROOMS = 10000  # Least recently used rooms are evicted beyond this
+# Lookup counters used to evaluate cache effectiveness
+_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
 
 
 def _is_cache_valid(timestamp: float) -> bool:
@@ -33,19 +37,27 @@ def _is_cache_valid(timestamp: float) -> bool:
 
 def _get_cached_room(room_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
     """Get cached room data if it exists and is still valid."""
-    if room_id in _room_cache:
-        data, timestamp = _room_cache[room_id]
+    entry = _room_cache.get(room_id)
+    if entry is not None:
+        data, timestamp = entry
         if _is_cache_valid(timestamp):
+            _room_cache.move_to_end(room_id)
+            _cache_stats["hits"] += 1
             return data
         else:
             # Remove expired entry
             del _room_cache[room_id]
+    _cache_stats["misses"] += 1
     return None
 
 
 def _cache_room_data(room_id: str, data: Dict[str, Dict[str, Any]]) -> None:
-    """Cache room data with current timestamp."""
+    """Cache room data with current timestamp, evicting the least recently used
+    rooms if the cache is full."""
     _room_cache[room_id] = (data, time.time())
+    _room_cache.move_to_end(room_id)
+    while len(_room_cache) > _CACHE_MAX_ROOMS:
+        _room_cache.popitem(last=False)
 
 
 def _cleanup_expired_cache() -> None:
@@ -206,68 +218,20 @@ def _add_membership_summary(
         room_data["membership_summary"] = membership_summary
 
 
-async def get_room_preview(
-    rooms: List[str],
-    api: ModuleApi,
+async def _fetch_from_db(
+    rooms_to_fetch: List[str],
     room_store: RoomStore,
     config: "SynapseRoomPreviewConfig",
 ) -> Dict[str, Dict[str, Dict[str, Any]]]:
     """
-    Get room preview data including state events for the specified rooms.
-
-    Uses an in-memory cache with 5-minute TTL for individual room data to improve
-    performance on repeated requests. The cache is reactively invalidated when
-    relevant state events change.
-
-    Returns a dictionary with the structure:
-    {
-        [room_id]: {
-            [state_event_type]: {
-                [state_key]: JSON
-            },
-            "membership_summary": {
-                [user_id]: [membership_status]
-            }
-        }
-    }
+    Query the configured state events for the given rooms from the database.
 
-    Note: Empty matrix state key will be represented as "default" in the response.
-    Note: The membership_summary only includes users who are referenced in the
-          activity roles state event, allowing clients to determine who has left
-          the room while still seeing all roles.
-
-    :param rooms: List of room IDs to get preview data for.
+    :param rooms_to_fetch: List of room IDs that are not in the cache.
     :param room_store: The RoomStore instance to query the database.
     :param config: The configuration containing state event types to query.
-    :return: A dictionary mapping room_id to state event data organized by
-             event type and state key, plus a membership_summary for activity roles.
+    :return: A dictionary mapping every requested room_id to its state event
+             data organized by event type and state key.
     """
-    if not rooms or not config.room_preview_state_event_types:
-        return {}
-
-    # Clean up expired cache entries periodically
-    _cleanup_expired_cache()
-
-    # Check cache for each room and separate cached vs uncached rooms
-    result: Dict[str, Dict[str, Dict[str, Any]]] = {}
-    rooms_to_fetch: List[str] = []
-
-    for room_id in rooms:
-        cached_data = _get_cached_room(room_id)
-        if cached_data is not None:
-            # Get current membership summary and add to cached data
-            # in case membership has changed since caching
-            membership_summary = await _get_membership_summary(room_id, api, room_store)
-            _add_membership_summary(cached_data, membership_summary)
-            result[room_id] = cached_data
-        else:
-            rooms_to_fetch.append(room_id)
-
-    # If all rooms were cached, return early
-    if not rooms_to_fetch:
-        return result
-
-    # Fetch uncached rooms from database
     # Check which database backend we are using
     database_engine = room_store.db_pool.engine.module.__name__
 
@@ -354,6 +318,73 @@ async def get_room_preview(
 
         fetched_room_data[room_id][event_type][key] = event_data
 
+    return fetched_room_data
+
+
+async def get_room_preview(
+    rooms: List[str],
+    api: ModuleApi,
+    room_store: RoomStore,
+    config: "SynapseRoomPreviewConfig",
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Get room preview data including state events for the specified rooms.
+
+    Uses an in-memory cache with 5-minute TTL for individual room data to improve
+    performance on repeated requests. The cache is reactively invalidated when
+    relevant state events change.
+
+    Returns a dictionary with the structure:
+    {
+        [room_id]: {
+            [state_event_type]: {
+                [state_key]: JSON
+            },
+            "membership_summary": {
+                [user_id]: [membership_status]
+            }
+        }
+    }
+
+    Note: Empty matrix state key will be represented as "default" in the response.
+    Note: The membership_summary only includes users who are referenced in the
+          activity roles state event, allowing clients to determine who has left
+          the room while still seeing all roles.
+
+    :param rooms: List of room IDs to get preview data for.
+    :param room_store: The RoomStore instance to query the database.
+    :param config: The configuration containing state event types to query.
+    :return: A dictionary mapping room_id to state event data organized by
+             event type and state key, plus a membership_summary for activity roles.
+    """
+    if not rooms or not config.room_preview_state_event_types:
+        return {}
+
+    # Clean up expired cache entries periodically
+    _cleanup_expired_cache()
+
+    # Check cache for each room and separate cached vs uncached rooms
+    result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    rooms_to_fetch: List[str] = []
+
+    for room_id in rooms:
+        cached_data = _get_cached_room(room_id)
+        if cached_data is not None:
+            # Get current membership summary and add to cached data
+            # in case membership has changed since caching
+            membership_summary = await _get_membership_summary(room_id, api, room_store)
+            _add_membership_summary(cached_data, membership_summary)
+            result[room_id] = cached_data
+        else:
+            rooms_to_fetch.append(room_id)
+
+    # If all rooms were cached, return early
+    if not rooms_to_fetch:
+        return result
+
+    # Fetch uncached rooms from database
+    fetched_room_data = await _fetch_from_db(rooms_to_fetch, room_store, config)
+
     # Cache each room's data individually and add to result
     for room_id, room_data in fetched_room_data.items():
         # Get current membership summary and add to room data
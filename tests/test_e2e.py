@@ -1,19 +1,62 @@
+"""
+End-to-end tests running the module in a real Synapse homeserver.
+
+Tests decorated with `db_test` run against each database backend listed in the
+comma-separated TEST_DBS environment variable. It defaults to `sqlite` for quick
+local runs; CI runs one job per database, each setting TEST_DBS to that one.
+"""
+
 import asyncio
+import atexit
+import copy
+import functools
+import hashlib
+import hmac
 import logging
 import os
 import shutil
+import signal
+import socket
 import subprocess
 import sys
 import tempfile
 import threading
-from typing import IO, Literal, Tuple, Union
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import (
+    IO,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 import aiounittest
+import orjson
 import psycopg2
 import requests
 import testing.postgresql
 import yaml
 from psycopg2.extensions import parse_dsn
+from requests.adapters import HTTPAdapter
+
+# Prefer the libyaml bindings for reading and writing homeserver configs
+try:
+    from yaml import CSafeDumper as YAMLDumper
+    from yaml import CSafeLoader as YAMLLoader
+except ImportError:
+    from yaml import SafeDumper as YAMLDumper  # type: ignore[assignment]
+    from yaml import SafeLoader as YAMLLoader  # type: ignore[assignment]
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -23,67 +66,377 @@ logging.basicConfig(
     filemode="w",
 )
 
+# Synapse's own output is discarded unless SYNAPSE_TEST_CAPTURE_LOGS=1, in which
+# case it is forwarded to synapse.log
+CAPTURE_SYNAPSE_LOGS = os.environ.get("SYNAPSE_TEST_CAPTURE_LOGS") == "1"
+
+# room_preview_state_event_types configured on the test homeservers
+DEFAULT_STATE_EVENT_TYPES = ("pangea.activity_plan", "pangea.activity_roles")
+JOIN_RULES_STATE_EVENT_TYPES = DEFAULT_STATE_EVENT_TYPES + ("m.room.join_rules",)
+COURSE_PLAN_STATE_EVENT_TYPES = ("pangea.course_plan",)
+
+# Homeserver settings layered over the template config: background work the
+# tests never exercise is switched off and rate limits are lifted, since the
+# homeservers are shared by all tests and see far more traffic than a client
+_UNLIMITED_RATE = {"per_second": 10000, "burst_count": 10000}
+TEST_HOMESERVER_CONFIG: Dict[str, Any] = {
+    "federation_sender_instances": [],
+    "presence": {"enabled": False},
+    "enable_metrics": False,
+    "url_preview_enabled": False,
+    "push": {"enabled": False},
+    "media_retention": {},
+    "caches": {"global_factor": 0.1},
+    "rc_registration": _UNLIMITED_RATE,
+    "rc_login": {
+        "address": _UNLIMITED_RATE,
+        "account": _UNLIMITED_RATE,
+        "failed_attempts": _UNLIMITED_RATE,
+    },
+    "rc_message": _UNLIMITED_RATE,
+    "rc_room_creation": _UNLIMITED_RATE,
+    "rc_joins": {"local": _UNLIMITED_RATE, "remote": _UNLIMITED_RATE},
+    "rc_joins_per_room": _UNLIMITED_RATE,
+    "rc_invites": {
+        "per_room": _UNLIMITED_RATE,
+        "per_user": _UNLIMITED_RATE,
+        "per_issuer": _UNLIMITED_RATE,
+    },
+}
+# Configuration of the module under test, besides its state event types
+TEST_MODULE_CONFIG: Dict[str, Any] = {"requests_per_burst": 10000}
+
+# Bounds of the exponential backoff between readiness probes of a starting
+# homeserver
+READINESS_MIN_INTERVAL = 0.025
+READINESS_MAX_INTERVAL = 0.5
+
+# A minimal hand-written homeserver config with its signing key and log config,
+# checked in so that no homeserver has to run `--generate-config`. Paths to the homeserver's directory use a placeholder. The files
+# are copied for every homeserver.
+HOMESERVER_TEMPLATE_DIR = os.path.join(
+    os.path.dirname(__file__), "fixtures", "homeserver"
+)
+_SYNAPSE_DIR_PLACEHOLDER = "@SYNAPSE_DIR@"
+# The parsed homeserver.yaml and the contents of the other template files, with
+# the log config already adjusted for the tests. Loaded once per test process.
+_homeserver_template: Optional[Tuple[Dict[str, Any], Dict[str, str]]] = None
+
+# The throwaway test cluster also does without the durability settings that
+# testing.postgresql leaves on (its defaults already include `-F`, no fsync)
+POSTGRES_ARGS = (
+    testing.postgresql.Postgresql.DEFAULT_SETTINGS["postgres_args"]
+    + " -c synchronous_commit=off -c full_page_writes=off"
+)
+
+# Postgres cluster shared by all PostgreSQL tests, started on first use.
+_postgres_cluster: Optional[testing.postgresql.Postgresql] = None
+
+# Homeservers shared by all tests using the same database backend and state
+# event types, started on first use and killed when the test run exits. Values
+# are their base URLs. Tests only ever create fresh rooms, so sharing a
+# homeserver does not couple them.
+_synapse_servers: Dict[Tuple[str, Tuple[str, ...]], str] = {}
+
+# Users already registered, by (homeserver URL, user)
+_registered_users: Set[Tuple[str, str]] = set()
+
+# Access tokens by (homeserver URL, user, password), so that repeated logins do
+# not each pay for a password hash on the server.
+_token_cache: Dict[Tuple[str, str, str], str] = {}
+
+# Homeserver directories live in memory where a tmpfs is available, which makes
+# both Synapse's disk I/O and their removal cheap
+_TMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Homeserver directories are moved here on teardown and deleted in the
+# background. It shares the homeserver directories' filesystem so the move is a
+# rename.
+_TRASH_DIR = tempfile.mkdtemp(prefix="synapse_trash_", dir=_TMP_ROOT)
+atexit.register(shutil.rmtree, _TRASH_DIR, ignore_errors=True)
+
+
+def _discard_dir(path: str) -> None:
+    """Move `path` out of the way and delete it on a background thread, so that
+    tests do not wait for large directory trees to be removed."""
+    trashed = os.path.join(_TRASH_DIR, f"{os.path.basename(path)}.{uuid.uuid4().hex}")
+    try:
+        os.rename(path, trashed)
+    except OSError:
+        # Not on the same filesystem as the trash directory
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    threading.Thread(
+        target=shutil.rmtree,
+        args=(trashed,),
+        kwargs={"ignore_errors": True},
+        daemon=True,
+    ).start()
+
+
+def _load_homeserver_template() -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Read the checked-in homeserver template and adjust its log config for the
+    tests."""
+    files = {}
+    for name in os.listdir(HOMESERVER_TEMPLATE_DIR):
+        with open(os.path.join(HOMESERVER_TEMPLATE_DIR, name), encoding="utf-8") as f:
+            files[name] = f.read()
+    config = yaml.load(files.pop("homeserver.yaml"), Loader=YAMLLoader)
+    if CAPTURE_SYNAPSE_LOGS:
+        # Only pay for formatting debug logs when they are actually kept
+        log_config_name = os.path.basename(config["log_config"])
+        log_config = yaml.load(files[log_config_name], Loader=YAMLLoader)
+        log_config["root"]["level"] = "DEBUG"
+        files[log_config_name] = yaml.dump(log_config, Dumper=YAMLDumper)
+    return config, files
+
+
+def _get_homeserver_template() -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Return the homeserver template, loading it on first use."""
+    global _homeserver_template
+    if _homeserver_template is None:
+        _homeserver_template = _load_homeserver_template()
+    return _homeserver_template
+
+
+def _copy_homeserver_template(synapse_dir: str) -> Dict[str, Any]:
+    """Write the files the homeserver config refers to (signing key and log
+    config) to `synapse_dir`, and return the config itself for the caller to
+    adjust and write. All are copied from the template, with its paths pointed
+    at `synapse_dir`."""
+    config, files = _get_homeserver_template()
+    for name, content in files.items():
+        with open(os.path.join(synapse_dir, name), "w", encoding="utf-8") as f:
+            f.write(content.replace(_SYNAPSE_DIR_PLACEHOLDER, synapse_dir))
+    return {
+        key: (
+            value.replace(_SYNAPSE_DIR_PLACEHOLDER, synapse_dir)
+            if isinstance(value, str)
+            else copy.deepcopy(value)
+        )
+        for key, value in config.items()
+    }
+
+
+def _prepare_synapse_dir(
+    db: Literal["sqlite", "postgresql"],
+    postgresql_url: Union[str, None],
+    room_preview_state_event_types: Sequence[str],
+) -> Tuple[str, str, str]:
+    """Create a homeserver directory with its config, for a homeserver on a free
+    port, and return its `(synapse_dir, config_path, base_url)`."""
+    synapse_dir = tempfile.mkdtemp(prefix="synapse_", dir=_TMP_ROOT)
+    try:
+        config_path = os.path.join(synapse_dir, "homeserver.yaml")
+        config = _copy_homeserver_template(synapse_dir)
+        config.update(TEST_HOMESERVER_CONFIG)
+        port = _free_port()
+        for listener in config["listeners"]:
+            listener["port"] = port
+        config["modules"] = [
+            {
+                "module": "synapse_room_preview.SynapseRoomPreview",
+                "config": {
+                    **TEST_MODULE_CONFIG,
+                    "room_preview_state_event_types": list(
+                        room_preview_state_event_types
+                    ),
+                },
+            }
+        ]
+        if db == "sqlite":
+            config["database"] = {
+                "name": "sqlite3",
+                "args": {"database": "homeserver.db"},
+            }
+        elif db == "postgresql":
+            assert postgresql_url is not None
+            config["database"] = {
+                "name": "psycopg2",
+                "args": parse_dsn(postgresql_url),
+            }
+        with open(config_path, "w", encoding="utf-8") as f:
+            yaml.dump(config, f, Dumper=YAMLDumper)
+    except Exception:
+        _discard_dir(synapse_dir)
+        raise
+    return synapse_dir, config_path, f"http://127.0.0.1:{port}"
+
+
+@functools.lru_cache(maxsize=None)
+def _auth_headers(access_token: str) -> Dict[str, str]:
+    """Return the headers authenticating a request with `access_token`. They are
+    built once per token and shared, so callers must not modify them."""
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+def _json(response: requests.Response) -> Any:
+    """Decode the JSON body of `response`."""
+    return orjson.loads(response.content)
+
+
+def _stop_synapse(
+    process: subprocess.Popen,
+    output_thread: Optional[threading.Thread],
+    synapse_dir: str,
+) -> None:
+    """Kill a shared test homeserver and throw away its data. Its database goes
+    away with the Postgres cluster, which is stopped after it."""
+    _kill(process)
+    if output_thread is not None:
+        output_thread.join()
+    _discard_dir(synapse_dir)
+
+
+def _free_port() -> int:
+    """Return a TCP port that is currently free, so that homeservers started by
+    parallel test processes (`trial -j N`) do not collide."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _kill(process: subprocess.Popen) -> None:
+    """Stop a test homeserver immediately. Its data is thrown away afterwards, so
+    there is no need to wait for a graceful shutdown."""
+    process.kill()
+    try:
+        process.wait(timeout=2)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+# Database backends every `db_test` is run against, from the comma-separated
+# TEST_DBS environment variable
+DATABASES = cast(
+    Tuple[Literal["sqlite", "postgresql"], ...],
+    tuple(db.strip() for db in os.environ.get("TEST_DBS", "sqlite").split(",")),
+)
+if not set(DATABASES) <= {"sqlite", "postgresql"}:
+    raise ValueError(f"Unsupported TEST_DBS value: {','.join(DATABASES)}")
+
+DBTest = Callable[[Any, Literal["sqlite", "postgresql"]], Awaitable[None]]
+
+
+def db_test(test: DBTest) -> DBTest:
+    """Mark a `_test_*(self, db)` method to be run once per database backend.
+
+    The actual `test_*_<db>` methods are generated by `expand_db_tests`."""
+    test._db_test = True
+    return test
 
+
+def _db_variant(test: DBTest, db: Literal["sqlite", "postgresql"], name: str):
+    @functools.wraps(test)
+    async def variant(self: Any) -> None:
+        await test(self, db)
+
+    variant.__name__ = variant.__qualname__ = name
+    return variant
+
+
+def expand_db_tests(cls: type) -> type:
+    """Class decorator adding a `test_<name>_<db>` method for every `db_test`
+    `_test_<name>` method of `cls` and every backend in `DATABASES`."""
+    for attr_name, test in list(vars(cls).items()):
+        if not getattr(test, "_db_test", False):
+            continue
+        for db in DATABASES:
+            name = f"test{attr_name[len('_test'):]}_{db}"
+            setattr(cls, name, _db_variant(test, db, name))
+    return cls
+
+
+@expand_db_tests
 class TestE2E(aiounittest.AsyncTestCase):
+    ROOM_PREVIEW_PATH = "/_synapse/client/unstable/org.pangea/room_preview"
+    # Error body returned for requests without a valid access token
+    UNAUTHORIZED_ERROR = {"error": "Unauthorized", "errcode": "M_UNAUTHORIZED"}
+    # URL of the homeserver used by the running test, on a free port
+    base_url: str
+    # Users given a role by create_room_with_activity_roles
+    ACTIVITY_ROLES_USERS = frozenset(
+        {
+            "@admin_user:my.domain.name",
+            "@user1:my.domain.name",
+            "@user2:my.domain.name",
+        }
+    )
+    # Users given a role in _test_left_users_in_activity_roles
+    COMPLETED_ACTIVITY_USERS = frozenset(
+        {
+            "@facilitator:my.domain.name",
+            "@participant1:my.domain.name",
+            "@participant2:my.domain.name",
+            "@participant3:my.domain.name",
+        }
+    )
+
+    @property
+    def room_preview_url(self) -> str:
+        return f"{self.base_url}{self.ROOM_PREVIEW_PATH}"
+
+    # Number of HTTP requests of a test that can be in flight at the same time
+    HTTP_CONCURRENCY = 32
+
+    def setUp(self) -> None:
+        # Reuse pooled keep-alive connections for all HTTP calls of a test
+        self._session = requests.Session()
+        # The homeserver is local; skip the proxy and netrc lookups done per request
+        self._session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.HTTP_CONCURRENCY)
+        self._session.mount("http://", adapter)
+        # The default executor only has a handful of threads, which would
+        # serialise larger `asyncio.gather` fan-outs
+        self._executor = ThreadPoolExecutor(max_workers=self.HTTP_CONCURRENCY)
+
+    def tearDown(self) -> None:
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Issue an HTTP request on the test's executor so that the event loop
+        stays free and independent requests can be awaited with `asyncio.gather`.
+
+        A `json` body is encoded here rather than by `requests`."""
+        kwargs.setdefault("timeout", 10)
+        if "json" in kwargs:
+            kwargs["data"] = orjson.dumps(kwargs.pop("json"))
+            kwargs["headers"] = {
+                **(kwargs.get("headers") or {}),
+                "Content-Type": "application/json",
+            }
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._session.request, method, url, **kwargs),
+        )
+
     async def start_test_synapse(
         self,
         db: Literal["sqlite", "postgresql"] = "sqlite",
         postgresql_url: Union[str, None] = None,
-    ) -> Tuple[str, str, subprocess.Popen, threading.Thread, threading.Thread]:
+        room_preview_state_event_types: Sequence[str] = DEFAULT_STATE_EVENT_TYPES,
+    ) -> Tuple[str, str, subprocess.Popen, Optional[threading.Thread]]:
+        if db == "sqlite" and postgresql_url is not None:
+            self.fail("PostgreSQL URL must not be defined when using SQLite database")
+        if db == "postgresql" and postgresql_url is None:
+            self.fail("PostgreSQL URL is required for PostgreSQL database")
+        # Copying the template and writing the config block on file I/O, so do
+        # it off the event loop
+        loop = asyncio.get_event_loop()
+        synapse_dir, config_path, self.base_url = await loop.run_in_executor(
+            self._executor,
+            functools.partial(
+                _prepare_synapse_dir,
+                db,
+                postgresql_url,
+                room_preview_state_event_types,
+            ),
+        )
+        server_process: Optional[subprocess.Popen] = None
+        output_thread = None
         try:
-            synapse_dir = tempfile.mkdtemp()
-            config_path = os.path.join(synapse_dir, "homeserver.yaml")
-            generate_config_cmd = [
-                sys.executable,
-                "-m",
-                "synapse.app.homeserver",
-                "--server-name=my.domain.name",
-                f"--config-path={config_path}",
-                "--report-stats=no",
-                "--generate-config",
-            ]
-            subprocess.check_call(generate_config_cmd)
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            log_config_path = config.get("log_config")
-            config["modules"] = [
-                {
-                    "module": "synapse_room_preview.SynapseRoomPreview",
-                    "config": {
-                        "room_preview_state_event_types": [
-                            "pangea.activity_plan",
-                            "pangea.activity_roles",
-                        ]
-                    },
-                }
-            ]
-            if db == "sqlite":
-                if postgresql_url is not None:
-                    self.fail(
-                        "PostgreSQL URL must not be defined when using SQLite database"
-                    )
-                config["database"] = {
-                    "name": "sqlite3",
-                    "args": {"database": "homeserver.db"},
-                }
-            elif db == "postgresql":
-                if postgresql_url is None:
-                    self.fail("PostgreSQL URL is required for PostgreSQL database")
-                dsn_params = parse_dsn(postgresql_url)
-                config["database"] = {
-                    "name": "psycopg2",
-                    "args": dsn_params,
-                }
-            with open(config_path, "w", encoding="utf-8") as f:
-                yaml.dump(config, f)
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            with open(log_config_path, "r", encoding="utf-8") as f:
-                log_config = yaml.safe_load(f)
-            log_config["root"]["handlers"] = ["console"]
-            log_config["root"]["level"] = "DEBUG"
-            with open(log_config_path, "w", encoding="utf-8") as f:
-                yaml.dump(log_config, f)
             run_server_cmd = [
                 sys.executable,
                 "-m",
@@ -91,135 +444,256 @@ class TestE2E(aiounittest.AsyncTestCase):
                 "--config-path",
                 config_path,
             ]
-            server_process = subprocess.Popen(
-                run_server_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=synapse_dir,
-                text=True,
-            )
-
-            def read_output(pipe: Union[IO[str], None]):
-                if pipe is None:
-                    return
-                for line in iter(pipe.readline, ""):
-                    logger.debug(line)
-                pipe.close()
+            if not CAPTURE_SYNAPSE_LOGS:
+                server_process = subprocess.Popen(
+                    run_server_cmd,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    cwd=synapse_dir,
+                )
+            else:
+                # stderr is merged into stdout so a single thread drains both
+                server_process = subprocess.Popen(
+                    run_server_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    cwd=synapse_dir,
+                )
 
-            stdout_thread = threading.Thread(
-                target=read_output, args=(server_process.stdout,)
-            )
-            stderr_thread = threading.Thread(
-                target=read_output, args=(server_process.stderr,)
-            )
-            stdout_thread.start()
-            stderr_thread.start()
-            server_url = "http://localhost:8008"
+                def read_output(pipe: Union[IO[bytes], None]):
+                    if pipe is None:
+                        return
+                    # Log each read's complete lines as one record, rather than
+                    # one record per line of Synapse's debug output
+                    pending = b""
+                    while True:
+                        chunk = os.read(pipe.fileno(), 1 << 16)
+                        if not chunk:
+                            break
+                        lines, _, pending = (pending + chunk).rpartition(b"\n")
+                        if lines:
+                            logger.debug(lines.decode(errors="replace"))
+                    if pending:
+                        logger.debug(pending.decode(errors="replace"))
+                    pipe.close()
+
+                # A daemon thread, as the interpreter waits for other threads
+                # before running the atexit hook that kills the homeserver
+                output_thread = threading.Thread(
+                    target=read_output, args=(server_process.stdout,), daemon=True
+                )
+                output_thread.start()
             max_wait_time = 10
-            wait_interval = 1
-            total_wait_time = 0
+            wait_interval = READINESS_MIN_INTERVAL
+            deadline = time.perf_counter() + max_wait_time
             server_ready = False
-            while not server_ready and total_wait_time < max_wait_time:
+            while not server_ready and time.perf_counter() < deadline:
                 try:
-                    response = requests.get(server_url, timeout=10)
+                    response = await self._request(
+                        "GET", f"{self.base_url}/health", timeout=0.25
+                    )
                     if response.status_code == 200:
                         server_ready = True
                         break
-                except requests.exceptions.ConnectionError:
+                except (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                ):
                     pass
-                finally:
-                    await asyncio.sleep(wait_interval)
-                    total_wait_time += wait_interval
+                await asyncio.sleep(wait_interval)
+                wait_interval = min(wait_interval * 1.5, READINESS_MAX_INTERVAL)
             if not server_ready:
                 self.fail("Synapse server did not start successfully")
-            return (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            )
+            return synapse_dir, config_path, server_process, output_thread
         except Exception as e:
-            server_process.terminate()
-            server_process.wait()
-            stdout_thread.join()
-            stderr_thread.join()
-            shutil.rmtree(synapse_dir)
+            if server_process is not None:
+                _kill(server_process)
+            if output_thread is not None:
+                output_thread.join()
+            _discard_dir(synapse_dir)
             raise e
 
-    async def start_test_postgres(self):
-        postgresql = None
+    async def use_shared_synapse(
+        self,
+        db: Literal["sqlite", "postgresql"],
+        room_preview_state_event_types: Sequence[str] = DEFAULT_STATE_EVENT_TYPES,
+    ) -> None:
+        """Point the test at the shared homeserver for `db` and
+        `room_preview_state_event_types`, starting it on first use."""
+        key = (db, tuple(room_preview_state_event_types))
+        if key not in _synapse_servers:
+            _synapse_servers[key] = await self.start_shared_synapse(
+                db, room_preview_state_event_types
+            )
+        self.base_url = _synapse_servers[key]
+
+    async def start_shared_synapse(
+        self,
+        db: Literal["sqlite", "postgresql"],
+        room_preview_state_event_types: Sequence[str],
+    ) -> str:
+        """Start a homeserver (and its database) that lives until the test run
+        exits, and return its base URL."""
+        postgres_url = None
+        if db == "postgresql":
+            postgres_url = await self.start_test_postgres()
         try:
-            postgresql = testing.postgresql.Postgresql()
-            postgres_url = postgresql.url()
-            max_waiting_time = 10
-            wait_interval = 1
-            total_wait_time = 0
-            postgres_is_up = False
-            while total_wait_time < max_waiting_time and not postgres_is_up:
-                try:
-                    conn = psycopg2.connect(postgres_url)
-                    conn.close()
-                    postgres_is_up = True
-                    break
-                except psycopg2.OperationalError:
-                    await asyncio.sleep(wait_interval)
-                    total_wait_time += wait_interval
-            if not postgres_is_up:
-                postgresql.stop()
-                self.fail("Postgres did not start successfully")
-            dbname = "testdb"
-            conn = psycopg2.connect(postgres_url)
+            (
+                synapse_dir,
+                config_path,
+                server_process,
+                output_thread,
+            ) = await self.start_test_synapse(
+                db=db,
+                postgresql_url=postgres_url,
+                room_preview_state_event_types=room_preview_state_event_types,
+            )
+        except Exception:
+            if postgres_url is not None:
+                self.drop_test_postgres(postgres_url)
+            raise
+        # Registered after the Postgres cluster's hook, so it runs before it
+        atexit.register(_stop_synapse, server_process, output_thread, synapse_dir)
+        return self.base_url
+
+    async def start_test_postgres(self) -> str:
+        """Create a fresh database on the shared Postgres cluster and return its URL.
+
+        The cluster itself is only started once per test run; each homeserver
+        gets its own database."""
+        global _postgres_cluster
+        if _postgres_cluster is None:
+            # Only returns once the cluster accepts connections
+            postgresql = testing.postgresql.Postgresql(postgres_args=POSTGRES_ARGS)
+            atexit.register(postgresql.stop, signal.SIGQUIT)
+            _postgres_cluster = postgresql
+        postgres_url = _postgres_cluster.url()
+        dbname = f"testdb_{uuid.uuid4().hex}"
+        with closing(psycopg2.connect(postgres_url)) as conn:
             conn.autocommit = True
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
-                CREATE DATABASE {dbname}
-                WITH TEMPLATE template0
-                LC_COLLATE 'C'
-                LC_CTYPE 'C';
-            """
-            )
-            cursor.close()
-            conn.close()
-            dsn_params = parse_dsn(postgres_url)
-            dsn_params["dbname"] = dbname
-            postgres_url_testdb = psycopg2.extensions.make_dsn(**dsn_params)
-            return postgresql, postgres_url_testdb
-        except Exception as e:
-            if postgresql is not None:
-                postgresql.stop()
-            raise e
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    CREATE DATABASE {dbname}
+                    WITH TEMPLATE template0
+                    LC_COLLATE 'C'
+                    LC_CTYPE 'C';
+                """
+                )
+        dsn_params = parse_dsn(postgres_url)
+        dsn_params["dbname"] = dbname
+        return psycopg2.extensions.make_dsn(**dsn_params)
+
+    def drop_test_postgres(self, postgres_url: str) -> None:
+        """Drop a database created by `start_test_postgres`. Synapse must have
+        been stopped first so that no connections to it remain."""
+        if _postgres_cluster is None:
+            return
+        dbname = parse_dsn(postgres_url)["dbname"]
+        with closing(psycopg2.connect(_postgres_cluster.url())) as conn:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP DATABASE IF EXISTS {dbname};")
 
-    async def register_user(
-        self, config_path: str, dir: str, user: str, password: str, admin: bool
-    ):
-        register_user_cmd = [
-            "register_new_matrix_user",
-            f"-c={config_path}",
-            f"--user={user}",
-            f"--password={password}",
-        ]
-        if admin:
-            register_user_cmd.append("--admin")
-        else:
-            register_user_cmd.append("--no-admin")
-        subprocess.check_call(register_user_cmd, cwd=dir)
+    async def _wait_until(
+        self,
+        room_preview_url: str,
+        headers: dict,
+        room_id: str,
+        predicate: Callable[[Dict[str, Any]], bool],
+        timeout: float = 5.0,
+        interval: float = 0.02,
+    ) -> Dict[str, Any]:
+        """Poll the room_preview endpoint for `room_id` until `predicate` holds for
+        the response body, and return that body."""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            response = await self._request(
+                "GET",
+                room_preview_url,
+                params={"rooms": room_id},
+                headers=headers,
+            )
+            self.assertEqual(response.status_code, 200)
+            data = _json(response)
+            if predicate(data):
+                return data
+            if loop.time() >= deadline:
+                self.fail(f"Room preview for {room_id} did not settle in {timeout}s")
+            await asyncio.sleep(interval)
+
+    async def register_user(self, user: str, password: str, admin: bool):
+        """Register `user` through the shared-secret registration admin API.
+
+        The response carries an access token, which is cached so that the
+        following `login_user` does not need another request."""
+        if (self.base_url, user) in _registered_users:
+            # Registered by an earlier test on the same shared homeserver
+            return
+        register_url = f"{self.base_url}/_synapse/admin/v1/register"
+        response = await self._request("GET", register_url)
+        self.assertEqual(response.status_code, 200)
+        nonce = _json(response)["nonce"]
+        config, _ = _get_homeserver_template()
+        mac = hmac.new(
+            config["registration_shared_secret"].encode(), digestmod=hashlib.sha1
+        )
+        mac.update(b"\x00".join([nonce.encode(), user.encode(), password.encode()]))
+        mac.update(b"\x00admin" if admin else b"\x00notadmin")
+        register_data = {
+            "nonce": nonce,
+            "username": user,
+            "password": password,
+            "admin": admin,
+            "mac": mac.hexdigest(),
+        }
+        response = await self._request("POST", register_url, json=register_data)
+        self.assertEqual(response.status_code, 200)
+        _token_cache[(self.base_url, user, password)] = _json(response)["access_token"]
+        _registered_users.add((self.base_url, user))
+
+    async def seed_users(self, users: List[Tuple[str, str, bool]]) -> List[str]:
+        """Register and log in `users`, given as (user, password, admin) tuples.
+
+        The calls for different users are independent, so all registrations and
+        then all logins are issued concurrently. Returns the access tokens in the
+        same order as `users`."""
+        await asyncio.gather(
+            *(
+                self.register_user(
+                    user=user,
+                    password=password,
+                    admin=admin,
+                )
+                for user, password, admin in users
+            )
+        )
+        return list(
+            await asyncio.gather(
+                *(self.login_user(user, password) for user, password, _ in users)
+            )
+        )
 
     async def login_user(self, user: str, password: str) -> str:
-        login_url = "http://localhost:8008/_matrix/client/v3/login"
+        key = (self.base_url, user, password)
+        if key in _token_cache:
+            return _token_cache[key]
+        login_url = f"{self.base_url}/_matrix/client/v3/login"
         login_data = {
             "type": "m.login.password",
             "user": user,
             "password": password,
         }
-        response = requests.post(login_url, json=login_data)
+        response = await self._request("POST", login_url, json=login_data)
         self.assertEqual(response.status_code, 200)
-        return response.json()["access_token"]
+        token = _json(response)["access_token"]
+        _token_cache[key] = token
+        return token
 
     async def create_private_room_knock_allowed_room(self, access_token: str) -> str:
-        headers = {"Authorization": f"Bearer {access_token}"}
-        create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
+        headers = _auth_headers(access_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
         create_room_data = {
             "visibility": "private",
             "preset": "private_chat",
@@ -231,117 +705,86 @@ class TestE2E(aiounittest.AsyncTestCase):
                 }
             ],
         }
-        response = requests.post(
+        response = await self._request(
+            "POST",
             create_room_url,
             json=create_room_data,
             headers=headers,
         )
         self.assertEqual(response.status_code, 200)
-        return response.json()["room_id"]
-
-    async def test_room_preview_sqlite(self):
-        await self._test_room_preview(db="sqlite")
-
-    async def test_room_preview_postgres(self):
-        await self._test_room_preview(db="postgresql")
+        return _json(response)["room_id"]
 
+    @db_test
     async def _test_room_preview(self, db: Literal["sqlite", "postgresql"]):
         """Setup test environment and run basic room preview tests."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register a user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="user1",
-                password="pw1",
-                admin=False,
-            )
+        await self.use_shared_synapse(db)
 
-            # Login user
-            token = await self.login_user("user1", "pw1")
+        # Register a user
+        await self.register_user(
+            user="user1",
+            password="pw1",
+            admin=False,
+        )
 
-            # Create a private room
-            room_id = await self.create_private_room_knock_allowed_room(token)
+        # Login user
+        token = await self.login_user("user1", "pw1")
 
-            # Test the room_preview endpoint
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {token}"}
+        # Create a private room
+        room_id = await self.create_private_room_knock_allowed_room(token)
 
-            # Run the individual test methods
-            await self._test_basic_room_preview_functionality(
-                room_preview_url, headers, room_id
-            )
-            await self._test_room_preview_data_structure(
-                room_preview_url, headers, room_id
-            )
+        # Test the room_preview endpoint
+        headers = _auth_headers(token)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Run the individual test methods. They only read the room, so
+        # their requests can be in flight together.
+        await asyncio.gather(
+            self._test_basic_room_preview_functionality(
+                self.room_preview_url, headers, room_id
+            ),
+            self._test_room_preview_data_structure(
+                self.room_preview_url, headers, room_id
+            ),
+        )
 
     async def _test_basic_room_preview_functionality(
         self, room_preview_url: str, headers: dict, room_id: str
     ):
         """Test basic room preview endpoint functionality."""
         # Test with no rooms parameter (should return empty rooms dict)
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"rooms": {}})
+        self.assertEqual(_json(response), {"rooms": {}})
 
         # Test with single room
         params = {"rooms": room_id}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
         self.assertIn("rooms", response_data)
         self.assertIn(room_id, response_data["rooms"])
 
         # Test with multiple rooms (comma-delimited)
         params = {"rooms": f"{room_id},!fake_room:example.com"}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
         self.assertIn("rooms", response_data)
         self.assertIn(room_id, response_data["rooms"])
         self.assertIn("!fake_room:example.com", response_data["rooms"])
@@ -351,14 +794,15 @@ class TestE2E(aiounittest.AsyncTestCase):
     ):
         """Test that the room preview data structure matches expected format."""
         params = {"rooms": room_id}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
 
         # Verify top-level structure
         self.assertIn("rooms", response_data)
@@ -401,102 +845,64 @@ class TestE2E(aiounittest.AsyncTestCase):
 
         # Test with fake room to ensure empty structure
         params = {"rooms": "!fake_room:example.com"}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
         self.assertIn("rooms", response_data)
         self.assertIn("!fake_room:example.com", response_data["rooms"])
         self.assertEqual(response_data["rooms"]["!fake_room:example.com"], {})
 
-    async def test_room_preview_with_room_state_events_sqlite(self):
-        """Test room preview with actual room state events (SQLite)."""
-        await self._test_room_preview_with_state_events(db="sqlite")
-
-    async def test_room_preview_with_room_state_events_postgres(self):
-        """Test room preview with actual room state events (PostgreSQL)."""
-        await self._test_room_preview_with_state_events(db="postgresql")
-
+    @db_test
     async def _test_room_preview_with_state_events(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Setup test environment and run room state events tests."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register a user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
+        await self.use_shared_synapse(db)
 
-            # Login admin user
-            admin_token = await self.login_user("admin_user", "admin_pw")
+        # Register a user
+        await self.register_user(
+            user="admin_user",
+            password="admin_pw",
+            admin=True,
+        )
 
-            # Create a room with specific state events
-            room_id = await self.create_room_with_state_events(admin_token)
+        # Login admin user
+        admin_token = await self.login_user("admin_user", "admin_pw")
 
-            # Test the room_preview endpoint
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {admin_token}"}
+        # Create a room with specific state events
+        room_id = await self.create_room_with_state_events(admin_token)
 
-            # Run the individual test methods
-            await self._test_room_with_state_events_functionality(
-                room_preview_url, headers, room_id
-            )
-            await self._test_multiple_rooms_with_mixed_existence(
-                room_preview_url, headers, room_id
-            )
+        # Test the room_preview endpoint
+        headers = _auth_headers(admin_token)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Run the individual test methods
+        await self._test_room_with_state_events_functionality(
+            self.room_preview_url, headers, room_id
+        )
+        await self._test_multiple_rooms_with_mixed_existence(
+            self.room_preview_url, headers, room_id
+        )
 
     async def _test_room_with_state_events_functionality(
         self, room_preview_url: str, headers: dict, room_id: str
     ):
         """Test room preview for room with state events."""
         params = {"rooms": room_id}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
 
         # Verify the room exists in response
         self.assertIn("rooms", response_data)
@@ -515,14 +921,15 @@ class TestE2E(aiounittest.AsyncTestCase):
         """Test multiple rooms including non-existent ones."""
         fake_room = "!nonexistent:example.com"
         params = {"rooms": f"{room_id},{fake_room}"}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
 
         # Both rooms should be in response
         self.assertIn(room_id, response_data["rooms"])
@@ -534,8 +941,8 @@ class TestE2E(aiounittest.AsyncTestCase):
 
     async def create_room_with_state_events(self, access_token: str) -> str:
         """Create a room with specific state events for testing."""
-        headers = {"Authorization": f"Bearer {access_token}"}
-        create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
+        headers = _auth_headers(access_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
         # Create room with name, topic, and avatar
         create_room_data = {
@@ -557,16 +964,17 @@ class TestE2E(aiounittest.AsyncTestCase):
             ],
         }
 
-        response = requests.post(
+        response = await self._request(
+            "POST",
             create_room_url,
             json=create_room_data,
             headers=headers,
         )
         self.assertEqual(response.status_code, 200)
-        room_id = response.json()["room_id"]
+        room_id = _json(response)["room_id"]
 
         # Add additional state events
-        state_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/state"
+        state_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/state"
 
         # Add pangea.activity_plan state event
         activity_plan_data = {
@@ -591,7 +999,8 @@ class TestE2E(aiounittest.AsyncTestCase):
             "created_by": "@admin_user:my.domain.name",
         }
 
-        plan_response = requests.put(
+        plan_response = await self._request(
+            "PUT",
             f"{state_url}/pangea.activity_plan/",
             json=activity_plan_data,
             headers=headers,
@@ -623,7 +1032,8 @@ class TestE2E(aiounittest.AsyncTestCase):
             },
         }
 
-        roles_response = requests.put(
+        roles_response = await self._request(
+            "PUT",
             f"{state_url}/pangea.activity_roles/",
             json=activity_roles_data,
             headers=headers,
@@ -748,223 +1158,125 @@ class TestE2E(aiounittest.AsyncTestCase):
                         f"Event type {event_type} should have 'default' as state key (empty keys are converted)"
                     )
 
-    async def test_room_preview_empty_cases_sqlite(self):
-        """Test room preview edge cases (SQLite)."""
-        await self._test_room_preview_empty_cases(db="sqlite")
-
-    async def test_room_preview_empty_cases_postgres(self):
-        """Test room preview edge cases (PostgreSQL)."""
-        await self._test_room_preview_empty_cases(db="postgresql")
-
+    @db_test
     async def _test_room_preview_empty_cases(self, db: Literal["sqlite", "postgresql"]):
         """Setup test environment and run empty/edge case tests."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register a user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="test_user",
-                password="test_pw",
-                admin=False,
-            )
+        await self.use_shared_synapse(db)
 
-            # Login user
-            token = await self.login_user("test_user", "test_pw")
+        # Register a user
+        await self.register_user(
+            user="test_user",
+            password="test_pw",
+            admin=False,
+        )
 
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {token}"}
+        # Login user
+        token = await self.login_user("test_user", "test_pw")
 
-            # Run the individual test methods
-            await self._test_empty_rooms_parameter(room_preview_url, headers)
-            await self._test_whitespace_rooms_parameter(room_preview_url, headers)
-            await self._test_mixed_valid_invalid_room_ids(room_preview_url, headers)
+        headers = _auth_headers(token)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Run the individual test methods
+        await self._test_empty_rooms_parameter(self.room_preview_url, headers)
+        await self._test_whitespace_rooms_parameter(self.room_preview_url, headers)
+        await self._test_mixed_valid_invalid_room_ids(self.room_preview_url, headers)
 
     async def _test_empty_rooms_parameter(self, room_preview_url: str, headers: dict):
         """Test with empty rooms parameter."""
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"rooms": {}})
+        self.assertEqual(_json(response), {"rooms": {}})
 
     async def _test_whitespace_rooms_parameter(
         self, room_preview_url: str, headers: dict
     ):
         """Test with whitespace-only rooms parameter."""
         params = {"rooms": "  ,  , "}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json(), {"rooms": {}})
+        self.assertEqual(_json(response), {"rooms": {}})
 
     async def _test_mixed_valid_invalid_room_ids(
         self, room_preview_url: str, headers: dict
     ):
         """Test with mix of valid and invalid room IDs."""
         params = {"rooms": "!valid:example.com,,  ,!another:example.com"}
-        response = requests.get(
+        response = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
         self.assertEqual(response.status_code, 200)
-        response_data = response.json()
+        response_data = _json(response)
         self.assertIn("rooms", response_data)
-        # Should have both valid room IDs
-        self.assertIn("!valid:example.com", response_data["rooms"])
-        self.assertIn("!another:example.com", response_data["rooms"])
-        # Both should be empty since they don't exist
-        self.assertEqual(response_data["rooms"]["!valid:example.com"], {})
-        self.assertEqual(response_data["rooms"]["!another:example.com"], {})
-
-    async def test_room_preview_cache_performance_sqlite(self):
-        """Test cache performance benefits (SQLite)."""
-        await self._test_cache_performance(db="sqlite")
-
-    async def test_room_preview_cache_performance_postgres(self):
-        """Test cache performance benefits (PostgreSQL)."""
-        await self._test_cache_performance(db="postgresql")
+        # Should have both valid room IDs, empty since they don't exist
+        self.assertEqual(
+            response_data["rooms"],
+            {"!valid:example.com": {}, "!another:example.com": {}},
+        )
 
+    @db_test
     async def _test_cache_performance(self, db: Literal["sqlite", "postgresql"]):
-        """Test that cache hits are faster than cache misses."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register a user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="perf_user",
-                password="perf_pw",
-                admin=True,
-            )
-
-            # Login user
-            token = await self.login_user("perf_user", "perf_pw")
+        """Test that repeated requests are served consistently from the cache."""
+        await self.use_shared_synapse(db)
+
+        # Register a user
+        await self.register_user(
+            user="perf_user",
+            password="perf_pw",
+            admin=True,
+        )
 
-            # Create a room with state events for testing
-            room_id = await self.create_room_with_state_events(token)
+        # Login user
+        token = await self.login_user("perf_user", "perf_pw")
 
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {token}"}
+        # Create a room with state events for testing
+        room_id = await self.create_room_with_state_events(token)
 
-            # Run cache performance test
-            await self._test_cache_hit_performance(room_preview_url, headers, room_id)
+        headers = _auth_headers(token)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Run cache performance test
+        await self._test_cache_hit_performance(self.room_preview_url, headers, room_id)
 
     async def _test_cache_hit_performance(
         self, room_preview_url: str, headers: dict, room_id: str
     ):
         """Test that the cache functions correctly and returns consistent data."""
-        import time
-
-        # Clear any existing cache by importing and clearing the cache directly
-        try:
-            from synapse_room_preview.get_room_preview import _room_cache
-
-            _room_cache.clear()
-        except ImportError:
-            pass  # Cache might not be accessible in test environment
-
         params = {"rooms": room_id}
 
-        # First request (cache miss) - measure and store result
-        print("\nCache Functionality Test:")
-
-        start_time = time.time()
-        response1 = requests.get(
+        # First request (cache miss)
+        response1 = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
-        miss_time = time.time() - start_time
-
         self.assertEqual(response1.status_code, 200)
-        first_result = response1.json()
+        first_result = _json(response1)
 
-        print(f"  First request (cache miss): {miss_time:.4f}s")
-
-        # Second request (should be cache hit) - measure and compare result
-        start_time = time.time()
-        response2 = requests.get(
+        # Second request (should be cache hit)
+        response2 = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=params,
             timeout=10,
         )
-        hit_time = time.time() - start_time
-
         self.assertEqual(response2.status_code, 200)
-        second_result = response2.json()
-
-        print(f"  Second request (cache hit): {hit_time:.4f}s")
+        second_result = _json(response2)
 
         # Verify cache returns identical data
         self.assertEqual(
@@ -981,30 +1293,29 @@ class TestE2E(aiounittest.AsyncTestCase):
 
         # Test multiple cache hits return consistent data
         for i in range(3):
-            response_n = requests.get(
-                room_preview_url, headers=headers, params=params, timeout=10
+            response_n = await self._request(
+                "GET", room_preview_url, headers=headers, params=params, timeout=10
             )
             self.assertEqual(response_n.status_code, 200)
             self.assertEqual(
-                response_n.json(),
+                _json(response_n),
                 first_result,
                 f"Cache hit #{i+3} should return identical data",
             )
 
-        print("  ✅ Cache returns consistent data across multiple requests")
-
         # Test cache with different room combinations
         other_room = "!nonexistent:example.com"
         mixed_params = {"rooms": f"{room_id},{other_room}"}
 
-        response_mixed = requests.get(
+        response_mixed = await self._request(
+            "GET",
             room_preview_url,
             headers=headers,
             params=mixed_params,
             timeout=10,
         )
         self.assertEqual(response_mixed.status_code, 200)
-        mixed_result = response_mixed.json()
+        mixed_result = _json(response_mixed)
 
         # The cached room should have the same data
         self.assertEqual(
@@ -1020,265 +1331,152 @@ class TestE2E(aiounittest.AsyncTestCase):
             "Non-existent room should return empty data",
         )
 
-        print("  ✅ Cache works correctly with mixed room requests")
-        print("  ✅ Cache functionality test completed successfully")
-
-        # Note: Performance benefits are more apparent in production environments
-        # where database queries are more complex and network latency is involved
-
-    async def test_room_preview_authentication_error_sqlite(self):
-        """Test 401 error for unauthenticated requests (SQLite)."""
-        await self._test_authentication_error(db="sqlite")
-
-    async def test_room_preview_authentication_error_postgres(self):
-        """Test 401 error for unauthenticated requests (PostgreSQL)."""
-        await self._test_authentication_error(db="postgresql")
-
+    @db_test
     async def _test_authentication_error(self, db: Literal["sqlite", "postgresql"]):
         """Test that unauthenticated requests return 401 error."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
+        await self.use_shared_synapse(db)
 
-            # Test the room_preview endpoint without authentication
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-
-            # Test with no authorization header
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": "!test:example.com"},
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 401)
-            response_data = response.json()
-            self.assertIn("error", response_data)
-            self.assertEqual(response_data["error"], "Unauthorized")
-            self.assertIn("errcode", response_data)
-            self.assertEqual(response_data["errcode"], "M_UNAUTHORIZED")
-
-            # Test with invalid authorization header
-            invalid_headers = {"Authorization": "Bearer invalid_token_12345"}
-            response = requests.get(
-                room_preview_url,
-                headers=invalid_headers,
-                params={"rooms": "!test:example.com"},
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 401)
-            response_data = response.json()
-            self.assertIn("error", response_data)
-            self.assertEqual(response_data["error"], "Unauthorized")
-            self.assertIn("errcode", response_data)
-            self.assertEqual(response_data["errcode"], "M_UNAUTHORIZED")
-
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Test the room_preview endpoint without authentication
 
-    async def test_activity_roles_filtering_sqlite(self):
-        await self._test_activity_roles_with_membership_summary(db="sqlite")
+        # Test with no authorization header
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": "!test:example.com"},
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 401)
+        response_data = _json(response)
+        self.assertEqual(
+            {key: response_data.get(key) for key in self.UNAUTHORIZED_ERROR},
+            self.UNAUTHORIZED_ERROR,
+        )
 
-    async def test_activity_roles_filtering_postgres(self):
-        await self._test_activity_roles_with_membership_summary(db="postgresql")
+        # Test with invalid authorization header
+        invalid_headers = {"Authorization": "Bearer invalid_token_12345"}
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            headers=invalid_headers,
+            params={"rooms": "!test:example.com"},
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 401)
+        response_data = _json(response)
+        self.assertEqual(
+            {key: response_data.get(key) for key in self.UNAUTHORIZED_ERROR},
+            self.UNAUTHORIZED_ERROR,
+        )
 
+    @db_test
     async def _test_activity_roles_with_membership_summary(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Test that activity roles include all users with membership summary."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register admin user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
-
-            # Register two test users
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="user1",
-                password="pw1",
-                admin=False,
-            )
-
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="user2",
-                password="pw2",
-                admin=False,
-            )
-
-            # Login users
-            admin_token = await self.login_user("admin_user", "admin_pw")
-            user1_token = await self.login_user("user1", "pw1")
-            user2_token = await self.login_user("user2", "pw2")
-
-            # Create a room with activity roles
-            room_id = await self.create_room_with_activity_roles(
-                admin_token, user1_token, user2_token
-            )
-
-            # Initially all users should be in the activity roles with join membership
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {admin_token}"}
-
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
-
-            # Verify all users are in activity roles
-            self.assertIn("rooms", data)
-            self.assertIn(room_id, data["rooms"])
-            room_data = data["rooms"][room_id]
-            self.assertIn("pangea.activity_roles", room_data)
+        await self.use_shared_synapse(db)
+
+        # Register and login admin user and two test users
+        admin_token, user1_token, user2_token = await self.seed_users(
+            [
+                ("admin_user", "admin_pw", True),
+                ("user1", "pw1", False),
+                ("user2", "pw2", False),
+            ],
+        )
 
-            activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
-                "roles"
-            ]
-            self.assertEqual(len(activity_roles), 3)  # admin + user1 + user2
-
-            # Verify all users are present in roles
-            user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
-            expected_users = {
-                "@admin_user:my.domain.name",
-                "@user1:my.domain.name",
-                "@user2:my.domain.name",
-            }
-            self.assertEqual(user_ids_in_roles, expected_users)
+        # Create a room with activity roles
+        room_id = await self.create_room_with_activity_roles(
+            admin_token, user1_token, user2_token
+        )
 
-            # Verify membership_summary is present and all users are "join"
-            self.assertIn("membership_summary", room_data)
-            membership_summary = room_data["membership_summary"]
-            self.assertEqual(
-                membership_summary.get("@admin_user:my.domain.name"), "join"
-            )
-            self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
-            self.assertEqual(membership_summary.get("@user2:my.domain.name"), "join")
-
-            # Remove user2 from the room (kick them)
-            kick_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/kick"
-            kick_data = {
-                "user_id": "@user2:my.domain.name",
-                "reason": "Test kick for membership summary",
-            }
-            kick_response = requests.post(
-                kick_url,
-                json=kick_data,
-                headers=headers,
-            )
-            self.assertEqual(kick_response.status_code, 200)
+        # Initially all users should be in the activity roles with join membership
+        headers = _auth_headers(admin_token)
 
-            # Wait a moment for the kick to be processed
-            await asyncio.sleep(0.5)
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": room_id},
+            headers=headers,
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 200)
+        data = _json(response)
 
-            # Request room preview again - user2's role should still be present
-            # but membership_summary should show user2 as "leave"
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
+        # Verify all users are in activity roles
+        self.assertIn("rooms", data)
+        self.assertIn(room_id, data["rooms"])
+        room_data = data["rooms"][room_id]
+        self.assertIn("pangea.activity_roles", room_data)
 
-            # Verify all users are still in activity roles (no filtering)
-            room_data = data["rooms"][room_id]
-            activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
-                "roles"
-            ]
+        activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
+            "roles"
+        ]
+        self.assertEqual(len(activity_roles), 3)  # admin + user1 + user2
+
+        # Verify all users are present in roles
+        user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
+        self.assertEqual(frozenset(user_ids_in_roles), self.ACTIVITY_ROLES_USERS)
+
+        # Verify membership_summary is present and all users are "join"
+        self.assertIn("membership_summary", room_data)
+        membership_summary = room_data["membership_summary"]
+        self.assertEqual(membership_summary.get("@admin_user:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user2:my.domain.name"), "join")
+
+        # Remove user2 from the room (kick them)
+        kick_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/kick"
+        kick_data = {
+            "user_id": "@user2:my.domain.name",
+            "reason": "Test kick for membership summary",
+        }
+        kick_response = await self._request(
+            "POST",
+            kick_url,
+            json=kick_data,
+            headers=headers,
+        )
+        self.assertEqual(kick_response.status_code, 200)
+
+        # Request room preview again once the kick has been processed -
+        # user2's role should still be present but membership_summary should
+        # show user2 as "leave"
+        data = await self._wait_until(
+            self.room_preview_url,
+            headers,
+            room_id,
+            lambda d: d["rooms"][room_id]["membership_summary"].get(
+                "@user2:my.domain.name"
+            )
+            == "leave",
+        )
 
-            # All three users should still be present in roles
-            self.assertEqual(len(activity_roles), 3)
+        # Verify all users are still in activity roles (no filtering)
+        room_data = data["rooms"][room_id]
+        activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
+            "roles"
+        ]
 
-            user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
-            expected_users = {
-                "@admin_user:my.domain.name",
-                "@user1:my.domain.name",
-                "@user2:my.domain.name",
-            }
-            self.assertEqual(user_ids_in_roles, expected_users)
+        # All three users should still be present in roles
+        self.assertEqual(len(activity_roles), 3)
 
-            # Verify membership_summary shows correct membership states
-            self.assertIn("membership_summary", room_data)
-            membership_summary = room_data["membership_summary"]
-            self.assertEqual(
-                membership_summary.get("@admin_user:my.domain.name"), "join"
-            )
-            self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
-            # user2 should now be "leave" in membership_summary
-            self.assertEqual(membership_summary.get("@user2:my.domain.name"), "leave")
+        user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
+        self.assertEqual(frozenset(user_ids_in_roles), self.ACTIVITY_ROLES_USERS)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Verify membership_summary shows correct membership states
+        self.assertIn("membership_summary", room_data)
+        membership_summary = room_data["membership_summary"]
+        self.assertEqual(membership_summary.get("@admin_user:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
+        # user2 should now be "leave" in membership_summary
+        self.assertEqual(membership_summary.get("@user2:my.domain.name"), "leave")
 
     async def create_room_with_activity_roles(
         self, admin_token: str, user1_token: str, user2_token: str
     ) -> str:
         """Create a room with both users invited and add activity roles for all."""
-        headers = {"Authorization": f"Bearer {admin_token}"}
-        create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
+        headers = _auth_headers(admin_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
         # Create room
         create_room_data = {
@@ -1288,27 +1486,17 @@ class TestE2E(aiounittest.AsyncTestCase):
             "invite": ["@user1:my.domain.name", "@user2:my.domain.name"],
         }
 
-        response = requests.post(
+        response = await self._request(
+            "POST",
             create_room_url,
             json=create_room_data,
             headers=headers,
         )
         self.assertEqual(response.status_code, 200)
-        room_id = response.json()["room_id"]
+        room_id = _json(response)["room_id"]
 
-        # Accept invitations for both users
-        join_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/join"
-
-        user1_headers = {"Authorization": f"Bearer {user1_token}"}
-        join_response1 = requests.post(join_url, headers=user1_headers)
-        self.assertEqual(join_response1.status_code, 200)
-
-        user2_headers = {"Authorization": f"Bearer {user2_token}"}
-        join_response2 = requests.post(join_url, headers=user2_headers)
-        self.assertEqual(join_response2.status_code, 200)
-
-        # Add activity roles state event with all three users
-        state_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/state"
+        # Activity roles state event with all three users
+        state_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/state"
         activity_roles_data = {
             "roles": {
                 "role-admin-123": {
@@ -1335,108 +1523,77 @@ class TestE2E(aiounittest.AsyncTestCase):
             }
         }
 
-        roles_response = requests.put(
-            f"{state_url}/pangea.activity_roles/",
-            json=activity_roles_data,
-            headers=headers,
+        # Accept invitations for both users while adding the activity roles; the
+        # state event does not depend on the joins, so the calls are independent
+        join_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/join"
+
+        user1_headers = _auth_headers(user1_token)
+        user2_headers = _auth_headers(user2_token)
+        join_response1, join_response2, roles_response = await asyncio.gather(
+            self._request("POST", join_url, headers=user1_headers),
+            self._request("POST", join_url, headers=user2_headers),
+            self._request(
+                "PUT",
+                f"{state_url}/pangea.activity_roles/",
+                json=activity_roles_data,
+                headers=headers,
+            ),
         )
+        self.assertEqual(join_response1.status_code, 200)
+        self.assertEqual(join_response2.status_code, 200)
         self.assertEqual(roles_response.status_code, 200)
 
         return room_id
 
-    async def test_activity_roles_filtering_no_roles_sqlite(self):
-        await self._test_activity_roles_filtering_no_roles(db="sqlite")
-
-    async def test_activity_roles_filtering_no_roles_postgres(self):
-        await self._test_activity_roles_filtering_no_roles(db="postgresql")
-
+    @db_test
     async def _test_activity_roles_filtering_no_roles(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Test that room preview works correctly when there are no activity roles."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register admin user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
+        await self.use_shared_synapse(db)
 
-            admin_token = await self.login_user("admin_user", "admin_pw")
+        # Register admin user
+        await self.register_user(
+            user="admin_user",
+            password="admin_pw",
+            admin=True,
+        )
 
-            # Create a room without activity roles
-            room_id = await self.create_private_room_knock_allowed_room(admin_token)
+        admin_token = await self.login_user("admin_user", "admin_pw")
 
-            # Request room preview - should work fine without activity roles
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {admin_token}"}
+        # Create a room without activity roles
+        room_id = await self.create_private_room_knock_allowed_room(admin_token)
 
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
-
-            # Should have room data but no activity roles
-            self.assertIn("rooms", data)
-            self.assertIn(room_id, data["rooms"])
-            room_data = data["rooms"][room_id]
-
-            # Activity roles should not be present (since we didn't create any)
-            # But the request should still succeed
-            if "pangea.activity_roles" in room_data:
-                # If present, should be empty or properly structured
-                activity_roles_data = room_data["pangea.activity_roles"]
-                self.assertIsInstance(activity_roles_data, dict)
-
-            # membership_summary should not be present if no activity roles
-            if "pangea.activity_roles" not in room_data:
-                self.assertNotIn("membership_summary", room_data)
-
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
-
-    async def test_left_users_in_activity_roles_sqlite(self):
-        """Test that left users are preserved in activity roles with membership summary (SQLite)."""
-        await self._test_left_users_in_activity_roles(db="sqlite")
-
-    async def test_left_users_in_activity_roles_postgres(self):
-        """Test that left users are preserved in activity roles with membership summary (PostgreSQL)."""
-        await self._test_left_users_in_activity_roles(db="postgresql")
+        # Request room preview - should work fine without activity roles
+        headers = _auth_headers(admin_token)
+
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": room_id},
+            headers=headers,
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 200)
+        data = _json(response)
+
+        # Should have room data but no activity roles
+        self.assertIn("rooms", data)
+        self.assertIn(room_id, data["rooms"])
+        room_data = data["rooms"][room_id]
+
+        # Activity roles should not be present (since we didn't create any)
+        # But the request should still succeed
+        if "pangea.activity_roles" in room_data:
+            # If present, should be empty or properly structured
+            activity_roles_data = room_data["pangea.activity_roles"]
+            self.assertIsInstance(activity_roles_data, dict)
+
+        # membership_summary should not be present if no activity roles
+        if "pangea.activity_roles" not in room_data:
+            self.assertNotIn("membership_summary", room_data)
 
+    @db_test
     async def _test_left_users_in_activity_roles(
         self, db: Literal["sqlite", "postgresql"]
     ):
@@ -1447,439 +1604,224 @@ class TestE2E(aiounittest.AsyncTestCase):
         - A membership summary should be returned so clients can display info about
           completed activities while knowing who has left
         """
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse(db=db, postgresql_url=postgres_url)
-
-            # Register users
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="facilitator",
-                password="fac_pw",
-                admin=True,
-            )
+        await self.use_shared_synapse(db)
+
+        # Register and login users
+        facilitator_token, p1_token, p2_token, p3_token = await self.seed_users(
+            [
+                ("facilitator", "fac_pw", True),
+                ("participant1", "p1_pw", False),
+                ("participant2", "p2_pw", False),
+                ("participant3", "p3_pw", False),
+            ],
+        )
 
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="participant1",
-                password="p1_pw",
-                admin=False,
-            )
+        # Create room and add users
+        headers = _auth_headers(facilitator_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="participant2",
-                password="p2_pw",
-                admin=False,
-            )
+        create_room_data = {
+            "visibility": "private",
+            "preset": "private_chat",
+            "name": "Completed Activity Room",
+            "invite": [
+                "@participant1:my.domain.name",
+                "@participant2:my.domain.name",
+                "@participant3:my.domain.name",
+            ],
+        }
 
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="participant3",
-                password="p3_pw",
-                admin=False,
-            )
+        response = await self._request(
+            "POST",
+            create_room_url,
+            json=create_room_data,
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        room_id = _json(response)["room_id"]
 
-            # Login users
-            facilitator_token = await self.login_user("facilitator", "fac_pw")
-            p1_token = await self.login_user("participant1", "p1_pw")
-            p2_token = await self.login_user("participant2", "p2_pw")
-            p3_token = await self.login_user("participant3", "p3_pw")
-
-            # Create room and add users
-            headers = {"Authorization": f"Bearer {facilitator_token}"}
-            create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
-
-            create_room_data = {
-                "visibility": "private",
-                "preset": "private_chat",
-                "name": "Completed Activity Room",
-                "invite": [
-                    "@participant1:my.domain.name",
-                    "@participant2:my.domain.name",
-                    "@participant3:my.domain.name",
-                ],
+        # Add activity roles - simulating a completed activity
+        state_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/state"
+        activity_roles_data = {
+            "roles": {
+                "role-fac": {
+                    "archived_at": "2024-01-01T10:00:00Z",
+                    "finished_at": "2024-01-01T09:30:00Z",
+                    "id": "role-fac",
+                    "role": "facilitator",
+                    "user_id": "@facilitator:my.domain.name",
+                },
+                "role-p1": {
+                    "archived_at": "2024-01-01T10:00:00Z",
+                    "finished_at": "2024-01-01T09:30:00Z",
+                    "id": "role-p1",
+                    "role": "presenter",
+                    "user_id": "@participant1:my.domain.name",
+                },
+                "role-p2": {
+                    "archived_at": "2024-01-01T10:00:00Z",
+                    "finished_at": "2024-01-01T09:30:00Z",
+                    "id": "role-p2",
+                    "role": "participant",
+                    "user_id": "@participant2:my.domain.name",
+                },
+                "role-p3": {
+                    "archived_at": "2024-01-01T10:00:00Z",
+                    "finished_at": "2024-01-01T09:30:00Z",
+                    "id": "role-p3",
+                    "role": "participant",
+                    "user_id": "@participant3:my.domain.name",
+                },
             }
+        }
 
-            response = requests.post(
-                create_room_url,
-                json=create_room_data,
-                headers=headers,
-            )
-            self.assertEqual(response.status_code, 200)
-            room_id = response.json()["room_id"]
-
-            # All participants join
-            join_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/join"
-
-            for token in [p1_token, p2_token, p3_token]:
-                join_response = requests.post(
-                    join_url, headers={"Authorization": f"Bearer {token}"}
-                )
-                self.assertEqual(join_response.status_code, 200)
-
-            # Add activity roles - simulating a completed activity
-            state_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/state"
-            activity_roles_data = {
-                "roles": {
-                    "role-fac": {
-                        "archived_at": "2024-01-01T10:00:00Z",
-                        "finished_at": "2024-01-01T09:30:00Z",
-                        "id": "role-fac",
-                        "role": "facilitator",
-                        "user_id": "@facilitator:my.domain.name",
-                    },
-                    "role-p1": {
-                        "archived_at": "2024-01-01T10:00:00Z",
-                        "finished_at": "2024-01-01T09:30:00Z",
-                        "id": "role-p1",
-                        "role": "presenter",
-                        "user_id": "@participant1:my.domain.name",
-                    },
-                    "role-p2": {
-                        "archived_at": "2024-01-01T10:00:00Z",
-                        "finished_at": "2024-01-01T09:30:00Z",
-                        "id": "role-p2",
-                        "role": "participant",
-                        "user_id": "@participant2:my.domain.name",
-                    },
-                    "role-p3": {
-                        "archived_at": "2024-01-01T10:00:00Z",
-                        "finished_at": "2024-01-01T09:30:00Z",
-                        "id": "role-p3",
-                        "role": "participant",
-                        "user_id": "@participant3:my.domain.name",
-                    },
-                }
-            }
+        # All participants join while the activity roles are added
+        join_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/join"
 
-            roles_response = requests.put(
+        *join_responses, roles_response = await asyncio.gather(
+            *(
+                self._request("POST", join_url, headers=_auth_headers(token))
+                for token in [p1_token, p2_token, p3_token]
+            ),
+            self._request(
+                "PUT",
                 f"{state_url}/pangea.activity_roles/",
                 json=activity_roles_data,
                 headers=headers,
-            )
-            self.assertEqual(roles_response.status_code, 200)
-
-            # participant2 and participant3 leave the room after the activity
-            leave_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/leave"
-
-            p2_leave = requests.post(
-                leave_url, headers={"Authorization": f"Bearer {p2_token}"}
-            )
-            self.assertEqual(p2_leave.status_code, 200)
-
-            p3_leave = requests.post(
-                leave_url, headers={"Authorization": f"Bearer {p3_token}"}
-            )
-            self.assertEqual(p3_leave.status_code, 200)
-
-            # Wait for the leave events to be processed
-            await asyncio.sleep(0.5)
-
-            # Request room preview - should return full roles with membership summary
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
+            ),
+        )
+        for join_response in join_responses:
+            self.assertEqual(join_response.status_code, 200)
+        self.assertEqual(roles_response.status_code, 200)
 
-            room_data = data["rooms"][room_id]
+        # participant2 and participant3 leave the room after the activity
+        leave_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/leave"
 
-            # Verify ALL roles are returned (not filtered)
-            self.assertIn("pangea.activity_roles", room_data)
-            activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
-                "roles"
-            ]
+        p2_leave, p3_leave = await asyncio.gather(
+            self._request("POST", leave_url, headers=_auth_headers(p2_token)),
+            self._request("POST", leave_url, headers=_auth_headers(p3_token)),
+        )
+        self.assertEqual(p2_leave.status_code, 200)
+        self.assertEqual(p3_leave.status_code, 200)
+
+        # Request room preview once the leave events have been processed -
+        # should return full roles with membership summary
+        left_users = (
+            "@participant2:my.domain.name",
+            "@participant3:my.domain.name",
+        )
 
-            # All 4 users should be in roles (even though 2 have left)
-            self.assertEqual(len(activity_roles), 4)
+        data = await self._wait_until(
+            self.room_preview_url,
+            headers,
+            room_id,
+            lambda d: all(
+                d["rooms"][room_id]["membership_summary"].get(user_id) == "leave"
+                for user_id in left_users
+            ),
+        )
 
-            user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
-            expected_users = {
-                "@facilitator:my.domain.name",
-                "@participant1:my.domain.name",
-                "@participant2:my.domain.name",
-                "@participant3:my.domain.name",
-            }
-            self.assertEqual(user_ids_in_roles, expected_users)
+        room_data = data["rooms"][room_id]
 
-            # Verify membership_summary is present and correct
-            self.assertIn("membership_summary", room_data)
-            membership_summary = room_data["membership_summary"]
+        # Verify ALL roles are returned (not filtered)
+        self.assertIn("pangea.activity_roles", room_data)
+        activity_roles = room_data["pangea.activity_roles"]["default"]["content"][
+            "roles"
+        ]
 
-            # Facilitator and participant1 should be "join"
-            self.assertEqual(
-                membership_summary.get("@facilitator:my.domain.name"), "join"
-            )
-            self.assertEqual(
-                membership_summary.get("@participant1:my.domain.name"), "join"
-            )
+        # All 4 users should be in roles (even though 2 have left)
+        self.assertEqual(len(activity_roles), 4)
 
-            # participant2 and participant3 should be "leave"
-            self.assertEqual(
-                membership_summary.get("@participant2:my.domain.name"), "leave"
-            )
-            self.assertEqual(
-                membership_summary.get("@participant3:my.domain.name"), "leave"
-            )
+        user_ids_in_roles = {role["user_id"] for role in activity_roles.values()}
+        self.assertEqual(frozenset(user_ids_in_roles), self.COMPLETED_ACTIVITY_USERS)
 
-            # Only users in activity roles should be in membership_summary
-            self.assertEqual(len(membership_summary), 4)
+        # Verify membership_summary is present and correct
+        self.assertIn("membership_summary", room_data)
+        membership_summary = room_data["membership_summary"]
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        # Facilitator and participant1 should be "join"
+        self.assertEqual(membership_summary.get("@facilitator:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@participant1:my.domain.name"), "join")
 
-    async def test_join_rules_filtering_sqlite(self):
-        await self._test_join_rules_content_filtering(db="sqlite")
+        # participant2 and participant3 should be "leave"
+        self.assertEqual(
+            membership_summary.get("@participant2:my.domain.name"), "leave"
+        )
+        self.assertEqual(
+            membership_summary.get("@participant3:my.domain.name"), "leave"
+        )
 
-    async def test_join_rules_filtering_postgres(self):
-        await self._test_join_rules_content_filtering(db="postgresql")
+        # Only users in activity roles should be in membership_summary
+        self.assertEqual(len(membership_summary), 4)
 
+    @db_test
     async def _test_join_rules_content_filtering(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Test that m.room.join_rules content only exposes the join_rule key."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-
-            # Start Synapse with m.room.join_rules in allowed state event types
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self._start_synapse_with_join_rules(
-                db=db, postgresql_url=postgres_url
-            )
-
-            # Register admin user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
-
-            admin_token = await self.login_user("admin_user", "admin_pw")
-
-            # Create a room with join_rules that has additional content
-            room_id = await self._create_room_with_complex_join_rules(admin_token)
+        await self.use_shared_synapse(db, JOIN_RULES_STATE_EVENT_TYPES)
 
-            # Request room preview
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {admin_token}"}
-
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
-
-            # Verify the response structure
-            self.assertIn("rooms", data)
-            self.assertIn(room_id, data["rooms"])
-            room_data = data["rooms"][room_id]
-
-            # Verify m.room.join_rules is present
-            self.assertIn("m.room.join_rules", room_data)
-            join_rules_data = room_data["m.room.join_rules"]
-            self.assertIn("default", join_rules_data)
-
-            # Get the join_rules event content
-            join_rules_event = join_rules_data["default"]
-            self.assertIn("content", join_rules_event)
-            join_rules_content = join_rules_event["content"]
-
-            # Verify ONLY join_rule key is present in content
-            self.assertIn("join_rule", join_rules_content)
-            self.assertEqual(join_rules_content["join_rule"], "knock")
-
-            # Verify other keys are NOT present (they should be filtered out)
-            # The room was created with additional content that should be stripped
-            self.assertEqual(
-                len(join_rules_content),
-                1,
-                f"join_rules content should only have 1 key (join_rule), but has: {list(join_rules_content.keys())}",
-            )
-            self.assertNotIn(
-                "allow",
-                join_rules_content,
-                "allow key should be filtered out from join_rules content",
-            )
-
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
-
-    async def _start_synapse_with_join_rules(
-        self,
-        db: Literal["sqlite", "postgresql"] = "sqlite",
-        postgresql_url: Union[str, None] = None,
-    ) -> Tuple[str, str, subprocess.Popen, threading.Thread, threading.Thread]:
-        """Start Synapse with m.room.join_rules in the allowed state event types."""
-        synapse_dir = tempfile.mkdtemp()
-        config_path = os.path.join(synapse_dir, "homeserver.yaml")
-
-        generate_config_cmd = [
-            sys.executable,
-            "-m",
-            "synapse.app.homeserver",
-            "--server-name=my.domain.name",
-            f"--config-path={config_path}",
-            "--report-stats=no",
-            "--generate-config",
-        ]
-        subprocess.check_call(generate_config_cmd)
+        # Register admin user
+        await self.register_user(
+            user="admin_user",
+            password="admin_pw",
+            admin=True,
+        )
 
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
+        admin_token = await self.login_user("admin_user", "admin_pw")
 
-        log_config_path = config.get("log_config")
+        # Create a room with join_rules that has additional content
+        room_id = await self._create_room_with_complex_join_rules(admin_token)
 
-        # Configure module with m.room.join_rules included
-        config["modules"] = [
-            {
-                "module": "synapse_room_preview.SynapseRoomPreview",
-                "config": {
-                    "room_preview_state_event_types": [
-                        "pangea.activity_plan",
-                        "pangea.activity_roles",
-                        "m.room.join_rules",
-                    ]
-                },
-            }
-        ]
+        # Request room preview
+        headers = _auth_headers(admin_token)
 
-        if db == "sqlite":
-            config["database"] = {
-                "name": "sqlite3",
-                "args": {"database": "homeserver.db"},
-            }
-        elif db == "postgresql":
-            if postgresql_url is None:
-                self.fail("PostgreSQL URL is required for PostgreSQL database")
-            dsn_params = parse_dsn(postgresql_url)
-            config["database"] = {
-                "name": "psycopg2",
-                "args": dsn_params,
-            }
-
-        with open(config_path, "w", encoding="utf-8") as f:
-            yaml.dump(config, f)
-
-        with open(log_config_path, "r", encoding="utf-8") as f:
-            log_config = yaml.safe_load(f)
-
-        log_config["root"]["handlers"] = ["console"]
-        log_config["root"]["level"] = "DEBUG"
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": room_id},
+            headers=headers,
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 200)
+        data = _json(response)
 
-        with open(log_config_path, "w", encoding="utf-8") as f:
-            yaml.dump(log_config, f)
+        # Verify the response structure
+        self.assertIn("rooms", data)
+        self.assertIn(room_id, data["rooms"])
+        room_data = data["rooms"][room_id]
 
-        run_server_cmd = [
-            sys.executable,
-            "-m",
-            "synapse.app.homeserver",
-            "--config-path",
-            config_path,
-        ]
+        # Verify m.room.join_rules is present
+        self.assertIn("m.room.join_rules", room_data)
+        join_rules_data = room_data["m.room.join_rules"]
+        self.assertIn("default", join_rules_data)
 
-        server_process = subprocess.Popen(
-            run_server_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=synapse_dir,
-            text=True,
-        )
+        # Get the join_rules event content
+        join_rules_event = join_rules_data["default"]
+        self.assertIn("content", join_rules_event)
+        join_rules_content = join_rules_event["content"]
 
-        def stream_output(pipe: IO[str], log_fn):
-            for line in pipe:
-                log_fn(line.strip())
+        # Verify ONLY join_rule key is present in content
+        self.assertIn("join_rule", join_rules_content)
+        self.assertEqual(join_rules_content["join_rule"], "knock")
 
-        stdout_thread = threading.Thread(
-            target=stream_output, args=(server_process.stdout, logger.info)
+        # Verify other keys are NOT present (they should be filtered out)
+        # The room was created with additional content that should be stripped
+        self.assertEqual(
+            len(join_rules_content),
+            1,
+            f"join_rules content should only have 1 key (join_rule), but has: {list(join_rules_content.keys())}",
         )
-        stderr_thread = threading.Thread(
-            target=stream_output, args=(server_process.stderr, logger.error)
+        self.assertNotIn(
+            "allow",
+            join_rules_content,
+            "allow key should be filtered out from join_rules content",
         )
-        stdout_thread.start()
-        stderr_thread.start()
-
-        # Wait for server to start
-        for _ in range(30):
-            try:
-                resp = requests.get("http://localhost:8008/_matrix/client/versions")
-                if resp.status_code == 200:
-                    break
-            except requests.exceptions.ConnectionError:
-                pass
-            await asyncio.sleep(1)
-        else:
-            self.fail("Synapse server did not start in time")
-
-        return synapse_dir, config_path, server_process, stdout_thread, stderr_thread
 
     async def _create_room_with_complex_join_rules(self, access_token: str) -> str:
         """Create a room with join_rules that contain additional content beyond join_rule."""
-        headers = {"Authorization": f"Bearer {access_token}"}
-        create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
+        headers = _auth_headers(access_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
         # Create room with knock join rule
         create_room_data = {
@@ -1904,395 +1846,169 @@ class TestE2E(aiounittest.AsyncTestCase):
             ],
         }
 
-        response = requests.post(
+        response = await self._request(
+            "POST",
             create_room_url,
             json=create_room_data,
             headers=headers,
         )
         self.assertEqual(response.status_code, 200)
-        return response.json()["room_id"]
-
-    async def test_join_rules_only_join_rule_key_sqlite(self):
-        """Test that when join_rules has only join_rule, it still works correctly."""
-        await self._test_join_rules_simple_content(db="sqlite")
-
-    async def test_join_rules_only_join_rule_key_postgres(self):
-        """Test that when join_rules has only join_rule, it still works correctly."""
-        await self._test_join_rules_simple_content(db="postgresql")
+        return _json(response)["room_id"]
 
+    @db_test
     async def _test_join_rules_simple_content(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Test m.room.join_rules filtering when content only has join_rule key."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self._start_synapse_with_join_rules(
-                db=db, postgresql_url=postgres_url
-            )
-
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
+        await self.use_shared_synapse(db, JOIN_RULES_STATE_EVENT_TYPES)
 
-            admin_token = await self.login_user("admin_user", "admin_pw")
-
-            # Create a room with simple join_rules (only join_rule key)
-            headers = {"Authorization": f"Bearer {admin_token}"}
-            create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
-
-            create_room_data = {
-                "visibility": "private",
-                "preset": "private_chat",
-                "name": "Test Room Simple Join Rules",
-                "initial_state": [
-                    {
-                        "type": "m.room.join_rules",
-                        "state_key": "",
-                        "content": {"join_rule": "invite"},
-                    },
-                ],
-            }
+        await self.register_user(
+            user="admin_user",
+            password="admin_pw",
+            admin=True,
+        )
 
-            response = requests.post(
-                create_room_url,
-                json=create_room_data,
-                headers=headers,
-            )
-            self.assertEqual(response.status_code, 200)
-            room_id = response.json()["room_id"]
+        admin_token = await self.login_user("admin_user", "admin_pw")
 
-            # Request room preview
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
+        # Create a room with simple join_rules (only join_rule key)
+        headers = _auth_headers(admin_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
-            preview_response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(preview_response.status_code, 200)
-            data = preview_response.json()
+        create_room_data = {
+            "visibility": "private",
+            "preset": "private_chat",
+            "name": "Test Room Simple Join Rules",
+            "initial_state": [
+                {
+                    "type": "m.room.join_rules",
+                    "state_key": "",
+                    "content": {"join_rule": "invite"},
+                },
+            ],
+        }
 
-            room_data = data["rooms"][room_id]
-            self.assertIn("m.room.join_rules", room_data)
+        response = await self._request(
+            "POST",
+            create_room_url,
+            json=create_room_data,
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        room_id = _json(response)["room_id"]
 
-            join_rules_content = room_data["m.room.join_rules"]["default"]["content"]
-            self.assertEqual(join_rules_content, {"join_rule": "invite"})
+        # Request room preview
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
+        preview_response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": room_id},
+            headers=headers,
+            timeout=10,
+        )
+        self.assertEqual(preview_response.status_code, 200)
+        data = _json(preview_response)
 
-    async def test_course_plan_with_membership_summary_sqlite(self):
-        await self._test_course_plan_with_membership_summary(db="sqlite")
+        room_data = data["rooms"][room_id]
+        self.assertIn("m.room.join_rules", room_data)
 
-    async def test_course_plan_with_membership_summary_postgres(self):
-        await self._test_course_plan_with_membership_summary(db="postgresql")
+        join_rules_content = room_data["m.room.join_rules"]["default"]["content"]
+        self.assertEqual(join_rules_content, {"join_rule": "invite"})
 
+    @db_test
     async def _test_course_plan_with_membership_summary(
         self, db: Literal["sqlite", "postgresql"]
     ):
         """Test that rooms with pangea.course_plan include membership_summary."""
-        postgres = None
-        postgres_url = None
-        synapse_dir = None
-        server_process = None
-        stdout_thread = None
-        stderr_thread = None
-        try:
-            if db == "postgresql":
-                postgres, postgres_url = await self.start_test_postgres()
-            (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            ) = await self.start_test_synapse_with_course_plan(
-                db=db, postgresql_url=postgres_url
-            )
-
-            # Register admin user
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="admin_user",
-                password="admin_pw",
-                admin=True,
-            )
-
-            # Register two test users
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="user1",
-                password="pw1",
-                admin=False,
-            )
-
-            await self.register_user(
-                config_path=config_path,
-                dir=synapse_dir,
-                user="user2",
-                password="pw2",
-                admin=False,
-            )
-
-            # Login users
-            admin_token = await self.login_user("admin_user", "admin_pw")
-            user1_token = await self.login_user("user1", "pw1")
-            user2_token = await self.login_user("user2", "pw2")
-
-            # Create a room with course_plan (not activity_roles)
-            room_id = await self.create_room_with_course_plan(
-                admin_token, user1_token, user2_token
-            )
-
-            # Request room preview - should include membership_summary for course rooms
-            room_preview_url = (
-                "http://localhost:8008/_synapse/client/unstable/org.pangea/room_preview"
-            )
-            headers = {"Authorization": f"Bearer {admin_token}"}
-
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
-
-            # Verify room data includes course_plan
-            self.assertIn("rooms", data)
-            self.assertIn(room_id, data["rooms"])
-            room_data = data["rooms"][room_id]
-            self.assertIn("pangea.course_plan", room_data)
-
-            # Verify course_plan content
-            course_plan = room_data["pangea.course_plan"]["default"]["content"]
-            self.assertIn("uuid", course_plan)
-
-            # Verify membership_summary is present for course rooms
-            self.assertIn("membership_summary", room_data)
-            membership_summary = room_data["membership_summary"]
-
-            # All joined users should be in membership_summary
-            self.assertEqual(
-                membership_summary.get("@admin_user:my.domain.name"), "join"
-            )
-            self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
-            self.assertEqual(membership_summary.get("@user2:my.domain.name"), "join")
-
-            # Kick user2 from the room
-            kick_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/kick"
-            kick_data = {
-                "user_id": "@user2:my.domain.name",
-                "reason": "Test kick for course plan membership summary",
-            }
-            kick_response = requests.post(
-                kick_url,
-                json=kick_data,
-                headers=headers,
-            )
-            self.assertEqual(kick_response.status_code, 200)
-
-            # Wait a moment for the kick to be processed
-            await asyncio.sleep(0.5)
-
-            # Request room preview again - user2 should be "leave"
-            response = requests.get(
-                room_preview_url,
-                params={"rooms": room_id},
-                headers=headers,
-                timeout=10,
-            )
-            self.assertEqual(response.status_code, 200)
-            data = response.json()
+        await self.use_shared_synapse(db, COURSE_PLAN_STATE_EVENT_TYPES)
+
+        # Register and login admin user and two test users
+        admin_token, user1_token, user2_token = await self.seed_users(
+            [
+                ("admin_user", "admin_pw", True),
+                ("user1", "pw1", False),
+                ("user2", "pw2", False),
+            ],
+        )
 
-            room_data = data["rooms"][room_id]
+        # Create a room with course_plan (not activity_roles)
+        room_id = await self.create_room_with_course_plan(
+            admin_token, user1_token, user2_token
+        )
 
-            # Verify membership_summary shows correct membership states
-            self.assertIn("membership_summary", room_data)
-            membership_summary = room_data["membership_summary"]
-            self.assertEqual(
-                membership_summary.get("@admin_user:my.domain.name"), "join"
-            )
-            self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
-            # user2 should now be "leave" in membership_summary
-            self.assertEqual(membership_summary.get("@user2:my.domain.name"), "leave")
+        # Request room preview - should include membership_summary for course rooms
+        headers = _auth_headers(admin_token)
 
-        finally:
-            if postgres is not None:
-                postgres.stop()
-            if server_process is not None:
-                server_process.terminate()
-                server_process.wait()
-            if stdout_thread is not None:
-                stdout_thread.join()
-            if stderr_thread is not None:
-                stderr_thread.join()
-            if synapse_dir is not None:
-                shutil.rmtree(synapse_dir)
-
-    async def start_test_synapse_with_course_plan(
-        self,
-        db: Literal["sqlite", "postgresql"] = "sqlite",
-        postgresql_url: Union[str, None] = None,
-    ) -> Tuple[str, str, subprocess.Popen, threading.Thread, threading.Thread]:
-        """Start synapse with course_plan in the allowed state event types."""
-        try:
-            synapse_dir = tempfile.mkdtemp()
-            config_path = os.path.join(synapse_dir, "homeserver.yaml")
-            generate_config_cmd = [
-                sys.executable,
-                "-m",
-                "synapse.app.homeserver",
-                "--server-name=my.domain.name",
-                f"--config-path={config_path}",
-                "--report-stats=no",
-                "--generate-config",
-            ]
-            subprocess.check_call(generate_config_cmd)
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            log_config_path = config.get("log_config")
-            # Include pangea.course_plan in allowed state event types
-            config["modules"] = [
-                {
-                    "module": "synapse_room_preview.SynapseRoomPreview",
-                    "config": {
-                        "room_preview_state_event_types": [
-                            "pangea.course_plan",
-                        ]
-                    },
-                }
-            ]
-            if db == "sqlite":
-                if postgresql_url is not None:
-                    self.fail(
-                        "PostgreSQL URL must not be defined when using SQLite database"
-                    )
-                config["database"] = {
-                    "name": "sqlite3",
-                    "args": {"database": "homeserver.db"},
-                }
-            elif db == "postgresql":
-                if postgresql_url is None:
-                    self.fail("PostgreSQL URL is required for PostgreSQL database")
-                dsn_params = parse_dsn(postgresql_url)
-                config["database"] = {
-                    "name": "psycopg2",
-                    "args": dsn_params,
-                }
-            with open(config_path, "w", encoding="utf-8") as f:
-                yaml.dump(config, f)
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
-            with open(log_config_path, "r", encoding="utf-8") as f:
-                log_config = yaml.safe_load(f)
-            log_config["root"]["handlers"] = ["console"]
-            log_config["root"]["level"] = "DEBUG"
-            with open(log_config_path, "w", encoding="utf-8") as f:
-                yaml.dump(log_config, f)
-            run_server_cmd = [
-                sys.executable,
-                "-m",
-                "synapse.app.homeserver",
-                "--config-path",
-                config_path,
-            ]
-            server_process = subprocess.Popen(
-                run_server_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                cwd=synapse_dir,
-                text=True,
-            )
+        response = await self._request(
+            "GET",
+            self.room_preview_url,
+            params={"rooms": room_id},
+            headers=headers,
+            timeout=10,
+        )
+        self.assertEqual(response.status_code, 200)
+        data = _json(response)
+
+        # Verify room data includes course_plan
+        self.assertIn("rooms", data)
+        self.assertIn(room_id, data["rooms"])
+        room_data = data["rooms"][room_id]
+        self.assertIn("pangea.course_plan", room_data)
+
+        # Verify course_plan content
+        course_plan = room_data["pangea.course_plan"]["default"]["content"]
+        self.assertIn("uuid", course_plan)
+
+        # Verify membership_summary is present for course rooms
+        self.assertIn("membership_summary", room_data)
+        membership_summary = room_data["membership_summary"]
+
+        # All joined users should be in membership_summary
+        self.assertEqual(membership_summary.get("@admin_user:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user2:my.domain.name"), "join")
+
+        # Kick user2 from the room
+        kick_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/kick"
+        kick_data = {
+            "user_id": "@user2:my.domain.name",
+            "reason": "Test kick for course plan membership summary",
+        }
+        kick_response = await self._request(
+            "POST",
+            kick_url,
+            json=kick_data,
+            headers=headers,
+        )
+        self.assertEqual(kick_response.status_code, 200)
+
+        # Request room preview again once the kick has been processed -
+        # user2 should be "leave"
+        data = await self._wait_until(
+            self.room_preview_url,
+            headers,
+            room_id,
+            lambda d: d["rooms"][room_id]["membership_summary"].get(
+                "@user2:my.domain.name"
+            )
+            == "leave",
+        )
 
-            def read_output(pipe: Union[IO[str], None]):
-                if pipe is None:
-                    return
-                for line in iter(pipe.readline, ""):
-                    logger.debug(line)
-                pipe.close()
+        room_data = data["rooms"][room_id]
 
-            stdout_thread = threading.Thread(
-                target=read_output, args=(server_process.stdout,)
-            )
-            stderr_thread = threading.Thread(
-                target=read_output, args=(server_process.stderr,)
-            )
-            stdout_thread.start()
-            stderr_thread.start()
-            server_url = "http://localhost:8008"
-            max_wait_time = 10
-            wait_interval = 1
-            total_wait_time = 0
-            server_ready = False
-            while not server_ready and total_wait_time < max_wait_time:
-                try:
-                    response = requests.get(server_url, timeout=10)
-                    if response.status_code == 200:
-                        server_ready = True
-                        break
-                except requests.exceptions.ConnectionError:
-                    pass
-                finally:
-                    await asyncio.sleep(wait_interval)
-                    total_wait_time += wait_interval
-            if not server_ready:
-                self.fail("Synapse server did not start successfully")
-            return (
-                synapse_dir,
-                config_path,
-                server_process,
-                stdout_thread,
-                stderr_thread,
-            )
-        except Exception as e:
-            server_process.terminate()
-            server_process.wait()
-            stdout_thread.join()
-            stderr_thread.join()
-            shutil.rmtree(synapse_dir)
-            raise e
+        # Verify membership_summary shows correct membership states
+        self.assertIn("membership_summary", room_data)
+        membership_summary = room_data["membership_summary"]
+        self.assertEqual(membership_summary.get("@admin_user:my.domain.name"), "join")
+        self.assertEqual(membership_summary.get("@user1:my.domain.name"), "join")
+        # user2 should now be "leave" in membership_summary
+        self.assertEqual(membership_summary.get("@user2:my.domain.name"), "leave")
 
     async def create_room_with_course_plan(
         self, admin_token: str, user1_token: str, user2_token: str
     ) -> str:
         """Create a room with users and add pangea.course_plan state event."""
-        headers = {"Authorization": f"Bearer {admin_token}"}
-        create_room_url = "http://localhost:8008/_matrix/client/v3/createRoom"
+        headers = _auth_headers(admin_token)
+        create_room_url = f"{self.base_url}/_matrix/client/v3/createRoom"
 
         # Create room
         create_room_data = {
@@ -2302,30 +2018,33 @@ class TestE2E(aiounittest.AsyncTestCase):
             "invite": ["@user1:my.domain.name", "@user2:my.domain.name"],
         }
 
-        response = requests.post(
+        response = await self._request(
+            "POST",
             create_room_url,
             json=create_room_data,
             headers=headers,
         )
         self.assertEqual(response.status_code, 200)
-        room_id = response.json()["room_id"]
+        room_id = _json(response)["room_id"]
 
         # Accept invitations for both users
-        join_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/join"
-
-        user1_headers = {"Authorization": f"Bearer {user1_token}"}
-        response = requests.post(join_url, headers=user1_headers)
-        self.assertEqual(response.status_code, 200)
+        join_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/join"
 
-        user2_headers = {"Authorization": f"Bearer {user2_token}"}
-        response = requests.post(join_url, headers=user2_headers)
-        self.assertEqual(response.status_code, 200)
+        user1_headers = _auth_headers(user1_token)
+        user2_headers = _auth_headers(user2_token)
+        join_response1, join_response2 = await asyncio.gather(
+            self._request("POST", join_url, headers=user1_headers),
+            self._request("POST", join_url, headers=user2_headers),
+        )
+        self.assertEqual(join_response1.status_code, 200)
+        self.assertEqual(join_response2.status_code, 200)
 
         # Add pangea.course_plan state event
-        state_url = f"http://localhost:8008/_matrix/client/v3/rooms/{room_id}/state/pangea.course_plan"
+        state_url = f"{self.base_url}/_matrix/client/v3/rooms/{room_id}/state/pangea.course_plan"
         course_plan_content = {"uuid": "b6989779-a498-4463-aac8-2ac06b2a0406"}
 
-        response = requests.put(
+        response = await self._request(
+            "PUT",
             state_url,
             json=course_plan_content,
             headers=headers,
@@ -6,79 +6,165 @@ This module tests that cache invalidation works correctly when state events are
 
 import unittest
 from typing import Any, Dict
+from unittest import mock
 
+import aiounittest
+from synapse.module_api import ModuleApi
+
+from synapse_room_preview import SynapseRoomPreviewConfig
 from synapse_room_preview.get_room_preview import (
     _cache_room_data,
+    _cache_stats,
     _get_cached_room,
     _room_cache,
+    get_room_preview,
     invalidate_room_cache,
 )
 
+# Room data shared by the tests below. The cache stores it by reference and
+# never modifies it.
+_TEST_DATA_1: Dict[str, Dict[str, Any]] = {
+    "p.room_summary": {"default": {"content": {"name": "Test Room 1"}}}
+}
+_TEST_DATA_2: Dict[str, Dict[str, Any]] = {
+    "p.room_summary": {"default": {"content": {"name": "Test Room 2"}}}
+}
+
 
 class TestReactiveCache(unittest.TestCase):
     def setUp(self) -> None:
         """Clear the cache before each test."""
         _room_cache.clear()
 
-    def test_invalidate_room_cache(self) -> None:
-        """Test that cache invalidation removes the specified room from cache."""
+    def test_invalidation_matrix(self) -> None:
+        """Test cache invalidation across scenarios, each using its own rooms."""
+        with self.subTest(scenario="no-op invalidate"):
+            # Invalidating a room that was never cached doesn't raise or touch
+            # other entries
+            room_id = "!sentinel:example.com"
+            _cache_room_data(room_id, _TEST_DATA_1)
+            invalidate_room_cache("!nonexistent:example.com")
+            self.assertEqual(_get_cached_room(room_id), _TEST_DATA_1)
+
+        with self.subTest(scenario="single"):
+            room_id = "!single:example.com"
+            _cache_room_data(room_id, _TEST_DATA_1)
+            self.assertEqual(_get_cached_room(room_id), _TEST_DATA_1)
+
+            invalidate_room_cache(room_id)
+            self.assertIsNone(_get_cached_room(room_id))
+
+        with self.subTest(scenario="multi-room isolation"):
+            room_id_1 = "!multi1:example.com"
+            room_id_2 = "!multi2:example.com"
+            _cache_room_data(room_id_1, _TEST_DATA_1)
+            _cache_room_data(room_id_2, _TEST_DATA_2)
+            self.assertIsNotNone(_get_cached_room(room_id_1))
+            self.assertIsNotNone(_get_cached_room(room_id_2))
+
+            # Invalidating one room leaves the other cached
+            invalidate_room_cache(room_id_1)
+            self.assertIsNone(_get_cached_room(room_id_1))
+            self.assertEqual(_get_cached_room(room_id_2), _TEST_DATA_2)
+
+        with self.subTest(scenario="re-cache after invalidate"):
+            room_id = "!recache:example.com"
+            _cache_room_data(room_id, _TEST_DATA_1)
+            invalidate_room_cache(room_id)
+
+            # Fresh data cached after an invalidation is served
+            _cache_room_data(room_id, _TEST_DATA_2)
+            self.assertEqual(_get_cached_room(room_id), _TEST_DATA_2)
+
+    def test_cache_hit_and_miss_counters(self) -> None:
+        """Test that cache lookups are counted as hits or misses."""
         room_id = "!test:example.com"
-        test_data: Dict[str, Dict[str, Any]] = {
-            "p.room_summary": {"default": {"content": {"name": "Test Room"}}}
-        }
+        hits, misses = _cache_stats["hits"], _cache_stats["misses"]
 
-        # Cache some data
-        _cache_room_data(room_id, test_data)
+        # First lookup is a miss
+        self.assertIsNone(_get_cached_room(room_id))
+        self.assertEqual(_cache_stats["hits"] - hits, 0)
+        self.assertEqual(_cache_stats["misses"] - misses, 1)
 
-        # Verify it's cached
-        cached_data = _get_cached_room(room_id)
-        self.assertIsNotNone(cached_data)
-        self.assertEqual(cached_data, test_data)
+        # Lookup after caching is a hit
+        _cache_room_data(room_id, _TEST_DATA_1)
+        self.assertEqual(_get_cached_room(room_id), _TEST_DATA_1)
+        self.assertEqual(_cache_stats["hits"] - hits, 1)
+        self.assertEqual(_cache_stats["misses"] - misses, 1)
 
-        # Invalidate the cache
+        # Lookup after invalidation is a miss again
         invalidate_room_cache(room_id)
+        self.assertIsNone(_get_cached_room(room_id))
+        self.assertEqual(_cache_stats["hits"] - hits, 1)
+        self.assertEqual(_cache_stats["misses"] - misses, 2)
 
-        # Verify it's no longer cached
-        cached_data = _get_cached_room(room_id)
-        self.assertIsNone(cached_data)
+    def test_least_recently_used_room_is_evicted(self) -> None:
+        """Test that caching beyond the size limit evicts the least recently used room."""
 
-    def test_invalidate_room_cache_nonexistent(self) -> None:
-        """Test that invalidating a non-existent room doesn't cause errors."""
-        room_id = "!nonexistent:example.com"
-
-        # This should not raise an exception
-        invalidate_room_cache(room_id)
+        with mock.patch("synapse_room_preview.get_room_preview._CACHE_MAX_ROOMS", 2):
+            _cache_room_data("!test1:example.com", _TEST_DATA_1)
+            _cache_room_data("!test2:example.com", _TEST_DATA_1)
 
-        # Cache should still be empty
-        self.assertEqual(len(_room_cache), 0)
+            # Looking up the first room makes the second one least recently used
+            self.assertIsNotNone(_get_cached_room("!test1:example.com"))
+            _cache_room_data("!test3:example.com", _TEST_DATA_1)
 
-    def test_invalidate_multiple_rooms(self) -> None:
-        """Test that invalidating one room doesn't affect other cached rooms."""
-        room_id_1 = "!test1:example.com"
-        room_id_2 = "!test2:example.com"
+        self.assertEqual(
+            list(_room_cache), ["!test1:example.com", "!test3:example.com"]
+        )
 
-        test_data_1: Dict[str, Dict[str, Any]] = {
-            "p.room_summary": {"default": {"content": {"name": "Test Room 1"}}}
-        }
-        test_data_2: Dict[str, Dict[str, Any]] = {
-            "p.room_summary": {"default": {"content": {"name": "Test Room 2"}}}
-        }
-
-        # Cache data for both rooms
-        _cache_room_data(room_id_1, test_data_1)
-        _cache_room_data(room_id_2, test_data_2)
+    def tearDown(self) -> None:
+        """Clear the cache after each test."""
+        _room_cache.clear()
 
-        # Verify both are cached
-        self.assertIsNotNone(_get_cached_room(room_id_1))
-        self.assertIsNotNone(_get_cached_room(room_id_2))
 
-        # Invalidate only the first room
-        invalidate_room_cache(room_id_1)
+class TestCachedRoomPreview(aiounittest.AsyncTestCase):
+    def setUp(self) -> None:
+        """Clear the cache before each test."""
+        _room_cache.clear()
 
-        # Verify only the first room is invalidated
-        self.assertIsNone(_get_cached_room(room_id_1))
-        self.assertIsNotNone(_get_cached_room(room_id_2))
-        self.assertEqual(_get_cached_room(room_id_2), test_data_2)
+    async def test_cached_room_skips_database(self) -> None:
+        """Test that a cached room is served without querying the database, with
+        its membership summary still refreshed."""
+        room_id = "!test:example.com"
+        user_id = "@user:example.com"
+        room_data: Dict[str, Dict[str, Any]] = {
+            "pangea.course_plan": {"default": {"content": {"uuid": "test-plan"}}}
+        }
+        api = mock.Mock(spec=ModuleApi)
+        api.get_room_state.return_value = {
+            ("m.room.member", user_id): {"content": {"membership": "join"}}
+        }
+        room_store = mock.Mock()
+        config = SynapseRoomPreviewConfig(
+            room_preview_state_event_types=["pangea.course_plan"]
+        )
+
+        with mock.patch(
+            "synapse_room_preview.get_room_preview._fetch_from_db",
+            return_value={room_id: room_data},
+        ) as fetch_from_db:
+            result = await get_room_preview([room_id], api, room_store, config)
+        fetch_from_db.assert_called_once()
+        self.assertIn(room_id, _room_cache)
+        self.assertEqual(result[room_id]["membership_summary"], {user_id: "join"})
+
+        # The user leaves after the room was cached
+        api.get_room_state.return_value = {
+            ("m.room.member", user_id): {"content": {"membership": "leave"}}
+        }
+        with mock.patch(
+            "synapse_room_preview.get_room_preview._fetch_from_db",
+            side_effect=AssertionError("should not be called"),
+        ):
+            cached_result = await get_room_preview([room_id], api, room_store, config)
+        self.assertEqual(
+            cached_result[room_id]["membership_summary"], {user_id: "leave"}
+        )
+        self.assertEqual(
+            cached_result[room_id]["pangea.course_plan"],
+            {"default": {"content": {"uuid": "test-plan"}}},
+        )
 
     def tearDown(self) -> None:
         """Clear the cache after each test."""